@@ -3,175 +3,345 @@ Utilidades para el DAG de Airflow - Extracción de datos
 Este módulo contiene las funciones para hacer scraping de propiedades
 """
 
-from bs4 import BeautifulSoup
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 import time
 import random
 import logging
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Optional
 
 logger = logging.getLogger(__name__)
 
+# Esquema de los datos crudos: todo texto salvo la fecha de scraping
+RAW_SCHEMA = pa.schema([
+    ('titulo', pa.string()),
+    ('precio', pa.string()),
+    ('ubicacion', pa.string()),
+    ('habitaciones', pa.string()),
+    ('banos', pa.string()),
+    ('superficie', pa.string()),
+    ('link', pa.string()),
+    ('imagen_url', pa.string()),
+    ('fecha_scraping', pa.timestamp('us')),
+    ('fuente', pa.string()),
+])
+RAW_COLUMNS = tuple(RAW_SCHEMA.names)
+
+def _empty_columns() -> Dict[str, List[Any]]:
+    """Acumulador columnar vacío con una lista por campo de RAW_SCHEMA"""
+    return {name: [] for name in RAW_COLUMNS}
+
+def _has_class(name: str) -> str:
+    """Predicado XPath equivalente a class_=name de BeautifulSoup"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Expresiones XPath compiladas una sola vez al importar el módulo
+_XP_IN_CONTAINER = etree.XPath(f"boolean(ancestor::div[{_has_class('listing__items')}])")
+_XP_TITLE = etree.XPath(f"(.//h2[{_has_class('card__title')}])[1]//text()")
+_XP_PRICE = etree.XPath(f"(.//p[{_has_class('card__price')}])[1]//text()")
+_XP_LOCATION = etree.XPath(f"(.//p[{_has_class('card__location')}])[1]//text()")
+_XP_LINK = etree.XPath("(.//a)[1]/@href")
+_XP_FEATURES = etree.XPath(f"(.//div[{_has_class('card__features')}])[1]//span")
+_XP_IMG = etree.XPath("(.//img)[1]/@src")
+
+# Palabra clave de cada característica -> campo de salida
+_FEATURE_RE = re.compile(r'amb|dor|baño|m²')
+_FEATURE_FIELDS = {
+    'amb': 'habitaciones',
+    'dor': 'habitaciones',
+    'baño': 'banos',
+    'm²': 'superficie',
+}
+
+# Claves de la configuración que intervienen en la URL de búsqueda
+_URL_KEYS = (
+    'property_type', 'operation_type', 'location', 'price_range_from',
+    'price_range_to', 'currency', 'sort_by'
+)
+
+@lru_cache(maxsize=64)
+def _search_url(base_url: str, url_items: frozenset) -> str:
+    """Arma la URL de búsqueda; cacheada por combinación de parámetros"""
+    config = dict(url_items)
+    url = f"{base_url}/{config['property_type']}-{config['operation_type']}"
+    
+    # Agregar ubicación
+    if config.get('location'):
+        url += f"/{config['location']}"
+    
+    # Agregar parámetros de precio
+    params = []
+    if config.get('price_range_from'):
+        params.append(f"precio-desde-{config['price_range_from']}")
+    if config.get('price_range_to'):
+        params.append(f"precio-hasta-{config['price_range_to']}")
+    
+    # Agregar moneda
+    if config.get('currency') and config['currency'] == 'dolares':
+        params.append("dolares")
+    
+    # Agregar ordenamiento
+    if config.get('sort_by'):
+        params.append(f"orden-{config['sort_by']}")
+    
+    if params:
+        url += "/" + "/".join(params)
+    
+    return url
+
+def _join_text(parts: Iterable[str]) -> str:
+    """Une nodos de texto como get_text(strip=True) de BeautifulSoup"""
+    return "".join(part.strip() for part in parts)
+
 class PropsScraper:
     """Clase principal para hacer scraping de propiedades"""
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 4):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # Pool de conexiones keep-alive y reintentos con backoff exponencial
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=('GET',)
+            )
+        )
+        self.session.mount('https://', adapter)
         self.base_url = "https://www.argenprop.com"
+        # Máximo de páginas descargándose en simultáneo
+        self.max_workers = max_workers
+        # Timestamp del último request y parsers reutilizables de cada worker
+        self._local = threading.local()
+        # Espera adaptativa compartida por los workers (segundos)
+        self._backoff = 0.5
+        self._backoff_lock = threading.Lock()
+        
+    def _wait_turn(self):
+        """Espacia los requests de cada worker según el backoff actual, con jitter"""
+        with self._backoff_lock:
+            delay = self._backoff
+        delay += random.uniform(0, 0.3)
+        last_request = getattr(self._local, 'last_request', None)
+        if last_request is not None:
+            remaining = last_request + delay - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._local.last_request = time.monotonic()
+    
+    def _page_parser(self, encoding: str):
+        """Parser incremental del worker para el encoding dado, reutilizado entre páginas"""
+        parsers = getattr(self._local, 'parsers', None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        parser = parsers.get(encoding)
+        if parser is None:
+            parser = parsers[encoding] = etree.HTMLPullParser(
+                events=('end',), tag='div', encoding=encoding,
+                recover=True, remove_blank_text=True
+            )
+        return parser
+    
+    def _adapt_backoff(self, ok: bool):
+        """Reduce la espera tras un éxito; la duplica (acotada) ante 429/5xx o errores"""
+        with self._backoff_lock:
+            if ok:
+                self._backoff = max(0.2, self._backoff * 0.8)
+            else:
+                self._backoff = min(30, self._backoff * 2 + random.random())
         
     def build_search_url(self, config: Dict[str, Any]) -> str:
         """Construye la URL de búsqueda basada en la configuración"""
-        url = f"{self.base_url}/{config['property_type']}-{config['operation_type']}"
-        
-        # Agregar ubicación
-        if config.get('location'):
-            url += f"/{config['location']}"
-        
-        # Agregar parámetros de precio
-        params = []
-        if config.get('price_range_from'):
-            params.append(f"precio-desde-{config['price_range_from']}")
-        if config.get('price_range_to'):
-            params.append(f"precio-hasta-{config['price_range_to']}")
-        
-        # Agregar moneda
-        if config.get('currency') and config['currency'] == 'dolares':
-            params.append("dolares")
-        
-        # Agregar ordenamiento
-        if config.get('sort_by'):
-            params.append(f"orden-{config['sort_by']}")
-        
-        if params:
-            url += "/" + "/".join(params)
-        
-        return url
+        # Solo las claves de la URL: el resto (ej. 'formats') puede no ser hasheable
+        url_items = frozenset((key, config[key]) for key in _URL_KEYS if key in config)
+        return _search_url(self.base_url, url_items)
     
-    def extract_property_data(self, property_element) -> Dict[str, Any]:
-        """Extrae los datos de una propiedad individual"""
+    def extract_property_data(self, property_element) -> Optional[tuple]:
+        """Extrae los datos de una propiedad individual, en el orden de RAW_COLUMNS"""
         try:
             # Título
-            title_elem = property_element.find('h2', class_='card__title')
-            title = title_elem.get_text(strip=True) if title_elem else "Sin título"
+            title = _join_text(_XP_TITLE(property_element)) or "Sin título"
             
             # Precio
-            price_elem = property_element.find('p', class_='card__price')
-            price = price_elem.get_text(strip=True) if price_elem else "Consultar precio"
+            price = _join_text(_XP_PRICE(property_element)) or "Consultar precio"
             
             # Ubicación
-            location_elem = property_element.find('p', class_='card__location')
-            location = location_elem.get_text(strip=True) if location_elem else "Ubicación no especificada"
+            location = _join_text(_XP_LOCATION(property_element)) or "Ubicación no especificada"
             
             # Link
-            link_elem = property_element.find('a')
-            link = self.base_url + link_elem.get('href') if link_elem and link_elem.get('href') else ""
+            hrefs = _XP_LINK(property_element)
+            link = self.base_url + hrefs[0] if hrefs and hrefs[0] else ""
             
             # Características (habitaciones, baños, etc.)
+            # Gana el último span de cada tipo: "dor" (que va después de "amb") pisa a "amb"
             features = {}
-            features_container = property_element.find('div', class_='card__features')
-            if features_container:
-                feature_items = features_container.find_all('span')
-                for item in feature_items:
-                    text = item.get_text(strip=True)
-                    if 'amb' in text or 'dor' in text:
-                        features['habitaciones'] = text
-                    elif 'baño' in text:
-                        features['banos'] = text
-                    elif 'm²' in text:
-                        features['superficie'] = text
+            search = _FEATURE_RE.search
+            for item in _XP_FEATURES(property_element):
+                text = _join_text(item.itertext())
+                match = search(text)
+                if match:
+                    features[_FEATURE_FIELDS[match.group()]] = text
             
             # Imagen
-            img_elem = property_element.find('img')
-            img_url = img_elem.get('src') if img_elem else ""
+            srcs = _XP_IMG(property_element)
+            img_url = srcs[0] if srcs else ""
             
-            return {
-                'titulo': title,
-                'precio': price,
-                'ubicacion': location,
-                'habitaciones': features.get('habitaciones', ''),
-                'banos': features.get('banos', ''),
-                'superficie': features.get('superficie', ''),
-                'link': link,
-                'imagen_url': img_url,
-                'fecha_scraping': datetime.now().isoformat(),
-                'fuente': 'ArgentProp'
-            }
+            return (
+                title,
+                price,
+                location,
+                features.get('habitaciones', ''),
+                features.get('banos', ''),
+                features.get('superficie', ''),
+                link,
+                img_url,
+                datetime.now(),
+                'ArgentProp'
+            )
             
         except Exception as e:
             logger.error(f"Error extrayendo datos de propiedad: {e}")
             return None
     
-    def scrape_page(self, url: str) -> List[Dict[str, Any]]:
-        """Hace scraping de una página específica"""
+    def _consume_cards(self, parser, columns: Dict[str, List[Any]]) -> bool:
+        """
+        Procesa los <div> ya cerrados por el parser incremental.
+        Extrae cada tarjeta dentro de listing__items y libera su subárbol.
+        Returns: True si se cerró el contenedor de propiedades
+        """
+        container_found = False
+        # Métodos resueltos una sola vez fuera del loop caliente
+        extract = self.extract_property_data
+        in_container = _XP_IN_CONTAINER
+        appenders = [columns[name].append for name in RAW_COLUMNS]
+        for _, elem in parser.read_events():
+            classes = elem.get('class', '').split()
+            if 'listing__items' in classes:
+                container_found = True
+            elif 'card' in classes and in_container(elem):
+                prop_data = extract(elem)
+                if prop_data:
+                    for append, value in zip(appenders, prop_data):
+                        append(value)
+                
+                # Liberar la tarjeta y las ya procesadas antes que ella
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        return container_found
+    
+    def scrape_page(self, url: str) -> Dict[str, List[Any]]:
+        """Hace scraping de una página específica y devuelve sus datos por columna"""
         try:
             logger.info(f"Scrapeando página: {url}")
             
-            # Delay aleatorio para evitar bloqueos
-            time.sleep(random.uniform(1, 3))
+            # Espera adaptativa por worker para evitar bloqueos
+            self._wait_turn()
             
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            # Con stream=True la conexión se libera recién al cerrar la respuesta:
+            # el with la cubre también cuando raise_for_status corta por error HTTP
+            with self.session.get(url, timeout=30, stream=True) as response:
+                status = response.status_code
+                self._adapt_backoff(not (status == 429 or status >= 500))
+                response.raise_for_status()
+                
+                # Usar el charset declarado por el servidor, o UTF-8 si no lo declara
+                content_type = response.headers.get('Content-Type', '').lower()
+                encoding = response.encoding if 'charset' in content_type else 'utf-8'
+                
+                # Parsear en streaming: las tarjetas se extraen a medida que se cierran
+                parser = self._page_parser(encoding)
+                columns = _empty_columns()
+                container_found = False
+                
+                for chunk in response.iter_content(chunk_size=65536):
+                    parser.feed(chunk)
+                    container_found |= self._consume_cards(parser, columns)
+            parser.close()
+            container_found |= self._consume_cards(parser, columns)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Buscar contenedor de propiedades
-            properties_container = soup.find('div', class_='listing__items')
-            if not properties_container:
+            if not container_found:
                 logger.warning("No se encontró contenedor de propiedades")
-                return []
-            
-            # Extraer propiedades individuales
-            property_elements = properties_container.find_all('div', class_='card')
+                return _empty_columns()
             
-            properties_data = []
-            for prop_elem in property_elements:
-                prop_data = self.extract_property_data(prop_elem)
-                if prop_data:
-                    properties_data.append(prop_data)
-            
-            logger.info(f"Extraídas {len(properties_data)} propiedades de la página")
-            return properties_data
+            logger.info(f"Extraídas {len(columns['titulo'])} propiedades de la página")
+            return columns
             
         except requests.RequestException as e:
+            # Incluye RetryError cuando se agotan los reintentos por 429/5xx
+            if e.response is None:
+                self._adapt_backoff(False)
             logger.error(f"Error de conexión: {e}")
-            return []
+            # Descartar parsers que pudieron quedar a medio alimentar
+            self._local.parsers = {}
+            return _empty_columns()
         except Exception as e:
             logger.error(f"Error general en scrape_page: {e}")
-            return []
+            self._local.parsers = {}
+            return _empty_columns()
     
-    def scrape_properties(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def scrape_properties(self, config: Dict[str, Any]) -> pa.Table:
         """Función principal para hacer scraping de propiedades"""
         logger.info("Iniciando scraping de propiedades")
         logger.info(f"Configuración: {config}")
         
         base_url = self.build_search_url(config)
         max_pages = config.get('max_pages', 5)
+        # Cota de requests simultáneos contra el sitio (cortesía)
+        max_workers = config.get('max_workers', self.max_workers)
         
-        all_properties = []
+        urls = [
+            base_url if page == 1 else f"{base_url}/pagina-{page}"
+            for page in range(1, max_pages + 1)
+        ]
+        if not urls:
+            return RAW_SCHEMA.empty_table()
+        
+        # Descargar todas las páginas en paralelo compartiendo la sesión
+        pages = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+            futures = {
+                executor.submit(self.scrape_page, url): page
+                for page, url in enumerate(urls, start=1)
+            }
+            for future in as_completed(futures):
+                pages[futures[future]] = future.result()
+        
+        # Cada página pasa a un RecordBatch Arrow y sus listas Python se liberan;
+        # la tabla final solo referencia los batches, sin concatenar listas
+        batches = []
+        total = 0
         
         for page in range(1, max_pages + 1):
-            if page == 1:
-                url = base_url
-            else:
-                url = f"{base_url}/pagina-{page}"
-            
-            page_properties = self.scrape_page(url)
+            page_columns = pages.pop(page)
             
-            if not page_properties:
+            if not page_columns['titulo']:
                 logger.warning(f"No se encontraron propiedades en página {page}, terminando")
                 break
             
-            all_properties.extend(page_properties)
-            logger.info(f"Página {page}/{max_pages} completada. Total acumulado: {len(all_properties)}")
+            batch = pa.RecordBatch.from_pydict(page_columns, schema=RAW_SCHEMA)
+            batches.append(batch)
+            total += batch.num_rows
+            logger.info(f"Página {page}/{max_pages} completada. Total acumulado: {total}")
         
-        logger.info(f"Scraping completado. Total de propiedades: {len(all_properties)}")
-        return all_properties
+        table = pa.Table.from_batches(batches, schema=RAW_SCHEMA)
+        logger.info(f"Scraping completado. Total de propiedades: {table.num_rows}")
+        return table
 
 def extract_properties_data(**context) -> str:
     """
@@ -190,6 +360,7 @@ def extract_properties_data(**context) -> str:
         'price_range_to': 300000,
         'currency': 'dolares',
         'max_pages': 10,
+        'max_workers': 4,
         'sort_by': 'masnuevos'
     }
     
@@ -202,21 +373,19 @@ def extract_properties_data(**context) -> str:
     scraper = PropsScraper()
     
     # Extraer datos
-    properties_data = scraper.scrape_properties(final_config)
+    table = scraper.scrape_properties(final_config)
     
-    if not properties_data:
+    if table.num_rows == 0:
         raise ValueError("No se pudieron extraer datos de propiedades")
     
-    # Guardar datos en archivo temporal
+    # Guardar datos en archivo temporal (Parquet columnar con esquema explícito)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    raw_data_path = f"/tmp/raw_properties_{timestamp}.json"
+    raw_data_path = f"/tmp/raw_properties_{timestamp}.parquet"
     
-    import json
-    with open(raw_data_path, 'w', encoding='utf-8') as f:
-        json.dump(properties_data, f, ensure_ascii=False, indent=2)
+    pq.write_table(table, raw_data_path, compression='zstd')
     
     logger.info(f"Datos extraídos guardados en: {raw_data_path}")
-    logger.info(f"Total de propiedades extraídas: {len(properties_data)}")
+    logger.info(f"Total de propiedades extraídas: {table.num_rows}")
     
     # Retornar path para siguiente task
     return raw_data_path
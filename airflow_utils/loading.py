@@ -5,14 +5,23 @@ Este módulo contiene las funciones para cargar los datos finales
 
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import orjson
 import logging
 import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# Columnas de baja cardinalidad que se guardan con codificación de diccionario
+_DICT_COLUMNS = ('barrio', 'zona', 'ciudad', 'calidad_nivel', 'fuente')
+
+# Columnas que lee validate_final_dataset del Parquet final
+_VALIDATION_COLUMNS = ['precio_valido', 'precio_numerico', 'barrio', 'link', 'calidad_score']
+
 class DataLoader:
     """Clase para cargar datos en diferentes destinos"""
     
@@ -20,20 +29,26 @@ class DataLoader:
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
     
-    def save_to_excel(self, df: pd.DataFrame, filename: str) -> str:
-        """Guarda DataFrame en formato Excel"""
+    def save_to_excel(self, df: pd.DataFrame, filename: str,
+                      stats: Optional[Dict[str, Any]] = None,
+                      include_stats: bool = False) -> str:
+        """Guarda DataFrame en formato Excel (hojas de estadísticas opcionales)"""
         filepath = os.path.join(self.data_dir, f"{filename}.xlsx")
         
         try:
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+            with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
                 # Hoja principal con todos los datos
                 df.to_excel(writer, sheet_name='Propiedades', index=False)
                 
-                # Hoja de estadísticas
-                self._create_stats_sheet(df, writer)
-                
-                # Hoja de calidad de datos
-                self._create_quality_sheet(df, writer)
+                if include_stats:
+                    if stats is None:
+                        stats = self.compute_stats(df)
+                    
+                    # Hoja de estadísticas
+                    self._create_stats_sheet(stats, writer)
+                    
+                    # Hoja de calidad de datos
+                    self._create_quality_sheet(stats, writer)
             
             logger.info(f"Datos guardados en Excel: {filepath}")
             return filepath
@@ -42,12 +57,16 @@ class DataLoader:
             logger.error(f"Error guardando Excel: {e}")
             raise
     
-    def save_to_csv(self, df: pd.DataFrame, filename: str) -> str:
-        """Guarda DataFrame en formato CSV"""
+    def save_to_csv(self, df: Union[pd.DataFrame, pa.Table], filename: str) -> str:
+        """Guarda DataFrame (o tabla Arrow ya convertida) en formato CSV"""
         filepath = os.path.join(self.data_dir, f"{filename}.csv")
         
         try:
-            df.to_csv(filepath, index=False, encoding='utf-8')
+            if isinstance(df, pa.Table):
+                # Writer CSV de Arrow: escribe la tabla sin volver a pasar por pandas
+                pa_csv.write_csv(df, filepath)
+            else:
+                df.to_csv(filepath, index=False, encoding='utf-8', chunksize=50_000)
             logger.info(f"Datos guardados en CSV: {filepath}")
             return filepath
             
@@ -55,12 +74,23 @@ class DataLoader:
             logger.error(f"Error guardando CSV: {e}")
             raise
     
-    def save_to_parquet(self, df: pd.DataFrame, filename: str) -> str:
-        """Guarda DataFrame en formato Parquet (más eficiente)"""
+    def save_to_parquet(self, df: Union[pd.DataFrame, pa.Table], filename: str) -> str:
+        """Guarda DataFrame (o tabla Arrow ya convertida) en formato Parquet (más eficiente)"""
         filepath = os.path.join(self.data_dir, f"{filename}.parquet")
         
         try:
-            df.to_parquet(filepath, index=False)
+            # Una tabla Arrow recibida se reutiliza tal cual, sin reconvertir desde pandas
+            table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+            # zstd + diccionario solo en columnas de baja cardinalidad
+            dict_columns = [col for col in _DICT_COLUMNS if col in table.column_names]
+            pq.write_table(
+                table,
+                filepath,
+                compression='zstd',
+                compression_level=3,
+                use_dictionary=dict_columns,
+                row_group_size=50_000
+            )
             logger.info(f"Datos guardados en Parquet: {filepath}")
             return filepath
             
@@ -69,12 +99,12 @@ class DataLoader:
             raise
     
     def save_to_json(self, df: pd.DataFrame, filename: str) -> str:
-        """Guarda DataFrame en formato JSON"""
-        filepath = os.path.join(self.data_dir, f"{filename}.json")
+        """Guarda DataFrame en formato JSON (NDJSON: un registro por línea)"""
+        filepath = os.path.join(self.data_dir, f"{filename}.jsonl")
         
         try:
-            # Convertir DataFrame a JSON con formato legible
-            df.to_json(filepath, orient='records', indent=2, force_ascii=False)
+            # JSON compacto por líneas: más chico y procesable en streaming
+            df.to_json(filepath, orient='records', lines=True, force_ascii=False)
             logger.info(f"Datos guardados en JSON: {filepath}")
             return filepath
             
@@ -82,81 +112,140 @@ class DataLoader:
             logger.error(f"Error guardando JSON: {e}")
             raise
     
-    def _create_stats_sheet(self, df: pd.DataFrame, writer):
+    def compute_stats(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Calcula una sola vez las métricas del dataset que usan las hojas
+        de estadísticas y calidad y el archivo de metadatos
+        """
+        total = len(df)
+        # Completitud de todas las columnas en una sola pasada vectorizada
+        no_nulos = {col: int(n) for col, n in df.notna().sum().items()}
+        stats = {
+            'total': total,
+            'tipos': {col: str(dtype) for col, dtype in df.dtypes.items()},
+            'no_nulos': no_nulos,
+            'precios_validos': int(df['precio_valido'].sum()) if 'precio_valido' in df.columns else 0,
+            'con_ubicacion': no_nulos.get('barrio', 0),
+            'precios': None,
+            'top_barrios': None,
+            'barrios_unicos': 0,
+            'habitaciones': None,
+            'calidad_nivel': None,
+            'calidad_score': None,
+        }
+        
+        # Estadísticas de precios (solo para propiedades con precio válido)
+        if 'precio_numerico' in df.columns and 'precio_valido' in df.columns:
+            # Máscara booleana sobre arrays numpy, sin DataFrames intermedios
+            precios = df['precio_numerico'].to_numpy(dtype=float, na_value=np.nan)
+            mask = df['precio_valido'].to_numpy(dtype=bool, na_value=False) & ~np.isnan(precios)
+            precios_validos = precios[mask]
+            if precios_validos.size:
+                stats['precios'] = {
+                    'mean': float(np.mean(precios_validos)),
+                    'median': float(np.median(precios_validos)),
+                    'min': float(np.min(precios_validos)),
+                    'max': float(np.max(precios_validos)),
+                    # ddof=1 como pandas; con un solo valor queda NaN
+                    'std': float(np.std(precios_validos, ddof=1)) if precios_validos.size > 1 else float('nan'),
+                }
+        
+        if 'barrio' in df.columns:
+            barrios = df['barrio'].value_counts()
+            stats['top_barrios'] = barrios.head(10)
+            stats['barrios_unicos'] = int(df['barrio'].nunique())
+        
+        if 'habitaciones' in df.columns:
+            stats['habitaciones'] = df['habitaciones'].value_counts().sort_index()
+        
+        if 'calidad_nivel' in df.columns:
+            stats['calidad_nivel'] = df['calidad_nivel'].value_counts()
+        
+        if 'calidad_score' in df.columns:
+            stats['calidad_score'] = {
+                'mean': float(df['calidad_score'].mean()),
+                'median': float(df['calidad_score'].median()),
+                'min': float(df['calidad_score'].min()),
+                'max': float(df['calidad_score'].max()),
+            }
+        
+        return stats
+    
+    def _write_rows(self, writer, sheet_name: str, rows):
+        """Escribe filas ya calculadas directo en una hoja nueva de xlsxwriter"""
+        worksheet = writer.book.add_worksheet(sheet_name)
+        for row_idx, row in enumerate(rows):
+            worksheet.write_row(row_idx, 0, row)
+    
+    def _create_stats_sheet(self, stats: Dict[str, Any], writer):
         """Crea hoja de estadísticas descriptivas"""
         try:
             stats_data = []
             
             # Estadísticas generales
             stats_data.extend([
-                ['Total de propiedades', len(df)],
-                ['Propiedades con precio válido', df['precio_valido'].sum()],
-                ['Propiedades con ubicación', df['barrio'].notna().sum()],
+                ['Total de propiedades', stats['total']],
+                ['Propiedades con precio válido', stats['precios_validos']],
+                ['Propiedades con ubicación', stats['con_ubicacion']],
                 ['', ''],
             ])
             
             # Estadísticas de precios (solo para propiedades con precio válido)
-            if 'precio_numerico' in df.columns:
-                precios_validos = df[df['precio_valido'] == True]['precio_numerico']
-                if not precios_validos.empty:
-                    stats_data.extend([
-                        ['=== ESTADÍSTICAS DE PRECIOS ===', ''],
-                        ['Precio promedio', f"${precios_validos.mean():,.2f}"],
-                        ['Precio mediano', f"${precios_validos.median():,.2f}"],
-                        ['Precio mínimo', f"${precios_validos.min():,.2f}"],
-                        ['Precio máximo', f"${precios_validos.max():,.2f}"],
-                        ['Desviación estándar', f"${precios_validos.std():,.2f}"],
-                        ['', ''],
-                    ])
+            precios = stats['precios']
+            if precios:
+                stats_data.extend([
+                    ['=== ESTADÍSTICAS DE PRECIOS ===', ''],
+                    ['Precio promedio', f"${precios['mean']:,.2f}"],
+                    ['Precio mediano', f"${precios['median']:,.2f}"],
+                    ['Precio mínimo', f"${precios['min']:,.2f}"],
+                    ['Precio máximo', f"${precios['max']:,.2f}"],
+                    ['Desviación estándar', f"${precios['std']:,.2f}"],
+                    ['', ''],
+                ])
             
             # Distribución por barrio (top 10)
-            if 'barrio' in df.columns:
-                top_barrios = df['barrio'].value_counts().head(10)
+            if stats['top_barrios'] is not None:
                 stats_data.extend([
                     ['=== TOP 10 BARRIOS ===', ''],
                 ])
-                for barrio, count in top_barrios.items():
+                for barrio, count in stats['top_barrios'].items():
                     stats_data.append([barrio, count])
                 stats_data.append(['', ''])
             
             # Distribución por número de habitaciones
-            if 'habitaciones' in df.columns:
-                hab_dist = df['habitaciones'].value_counts().sort_index()
+            if stats['habitaciones'] is not None:
                 stats_data.extend([
                     ['=== DISTRIBUCIÓN POR HABITACIONES ===', ''],
                 ])
-                for hab, count in hab_dist.items():
+                for hab, count in stats['habitaciones'].items():
                     if pd.notna(hab):
                         stats_data.append([f"{int(hab)} habitaciones", count])
                 stats_data.append(['', ''])
             
             # Calidad de datos
-            if 'calidad_nivel' in df.columns:
-                calidad_dist = df['calidad_nivel'].value_counts()
+            if stats['calidad_nivel'] is not None:
                 stats_data.extend([
                     ['=== CALIDAD DE DATOS ===', ''],
                 ])
-                for nivel, count in calidad_dist.items():
+                for nivel, count in stats['calidad_nivel'].items():
                     stats_data.append([f"Calidad {nivel}", count])
             
-            # Crear DataFrame de estadísticas
-            stats_df = pd.DataFrame(stats_data, columns=['Métrica', 'Valor'])
-            stats_df.to_excel(writer, sheet_name='Estadísticas', index=False)
+            # Escribir la hoja de estadísticas
+            self._write_rows(writer, 'Estadísticas', [['Métrica', 'Valor']] + stats_data)
             
         except Exception as e:
             logger.error(f"Error creando hoja de estadísticas: {e}")
     
-    def _create_quality_sheet(self, df: pd.DataFrame, writer):
+    def _create_quality_sheet(self, stats: Dict[str, Any], writer):
         """Crea hoja de reporte de calidad de datos"""
         try:
             quality_data = []
             
             # Completitud de datos
             completitud = []
-            for col in df.columns:
+            total = stats['total']
+            for col, no_nulos in stats['no_nulos'].items():
                 if col not in ['fecha_scraping', 'fecha_transformacion']:
-                    total = len(df)
-                    no_nulos = df[col].notna().sum()
                     porcentaje = (no_nulos / total * 100) if total > 0 else 0
                     completitud.append([col, no_nulos, total, f"{porcentaje:.1f}%"])
             
@@ -168,24 +257,31 @@ class DataLoader:
             quality_data.append(['', '', '', ''])
             
             # Distribución de calidad
-            if 'calidad_score' in df.columns:
+            score = stats['calidad_score']
+            if score:
                 quality_data.extend([
                     ['=== DISTRIBUCIÓN DE CALIDAD ===', '', '', ''],
-                    ['Score promedio', f"{df['calidad_score'].mean():.1f}", '', ''],
-                    ['Score mediano', f"{df['calidad_score'].median():.1f}", '', ''],
-                    ['Score mínimo', f"{df['calidad_score'].min():.1f}", '', ''],
-                    ['Score máximo', f"{df['calidad_score'].max():.1f}", '', ''],
+                    ['Score promedio', f"{score['mean']:.1f}", '', ''],
+                    ['Score mediano', f"{score['median']:.1f}", '', ''],
+                    ['Score mínimo', f"{score['min']:.1f}", '', ''],
+                    ['Score máximo', f"{score['max']:.1f}", '', ''],
                 ])
             
-            # Crear DataFrame de calidad
-            quality_df = pd.DataFrame(quality_data)
-            quality_df.to_excel(writer, sheet_name='Calidad', index=False, header=False)
+            # Escribir la hoja de calidad
+            self._write_rows(writer, 'Calidad', quality_data)
             
         except Exception as e:
             logger.error(f"Error creando hoja de calidad: {e}")
     
-    def create_metadata_file(self, df: pd.DataFrame, filename: str) -> str:
+    def create_metadata_file(self, df: pd.DataFrame, filename: str,
+                             stats: Optional[Dict[str, Any]] = None) -> str:
         """Crea archivo de metadatos del dataset"""
+        if stats is None:
+            stats = self.compute_stats(df)
+        
+        total = stats['total']
+        precios = stats['precios']
+        score = stats['calidad_score']
         metadata = {
             'dataset_info': {
                 'nombre': 'Propiedades ArgentProp',
@@ -193,31 +289,34 @@ class DataLoader:
                 'fecha_creacion': datetime.now().isoformat(),
                 'fuente': 'ArgentProp (www.argenprop.com)',
                 'metodo_extraccion': 'Web Scraping automatizado',
-                'total_registros': len(df),
+                'total_registros': total,
                 'periodo': 'Datos actuales al momento del scraping'
             },
             'esquema': {
                 col: {
-                    'tipo': str(df[col].dtype),
-                    'nulos': int(df[col].isna().sum()),
-                    'completitud': f"{((len(df) - df[col].isna().sum()) / len(df) * 100):.1f}%"
-                } for col in df.columns
+                    'tipo': stats['tipos'][col],
+                    'nulos': total - no_nulos,
+                    'completitud': f"{(no_nulos / total * 100) if total > 0 else 0:.1f}%"
+                } for col, no_nulos in stats['no_nulos'].items()
             },
             'estadisticas': {
-                'precios_validos': int(df['precio_valido'].sum()) if 'precio_valido' in df.columns else 0,
-                'precio_promedio': float(df[df['precio_valido'] == True]['precio_numerico'].mean()) if 'precio_numerico' in df.columns and df['precio_valido'].any() else None,
-                'barrios_unicos': int(df['barrio'].nunique()) if 'barrio' in df.columns else 0,
-                'calidad_promedio': float(df['calidad_score'].mean()) if 'calidad_score' in df.columns else None
+                'precios_validos': stats['precios_validos'],
+                'precio_promedio': precios['mean'] if precios else None,
+                'barrios_unicos': stats['barrios_unicos'],
+                'calidad_promedio': score['mean'] if score else None
             },
             'calidad': {
-                'score_promedio': float(df['calidad_score'].mean()) if 'calidad_score' in df.columns else None,
-                'distribucion_calidad': df['calidad_nivel'].value_counts().to_dict() if 'calidad_nivel' in df.columns else {}
+                'score_promedio': score['mean'] if score else None,
+                'distribucion_calidad': stats['calidad_nivel'].to_dict() if stats['calidad_nivel'] is not None else {}
             }
         }
         
         filepath = os.path.join(self.data_dir, f"{filename}_metadata.json")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False, default=str)
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(
+                metadata,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ))
         
         logger.info(f"Metadatos guardados en: {filepath}")
         return filepath
@@ -236,6 +335,11 @@ def load_final_dataset(**context) -> Dict[str, str]:
     # Cargar datos transformados
     df = pd.read_parquet(transformed_data_path)
     
+    # Columnas repetitivas como categóricas: menos memoria y conteos más rápidos
+    for col in _DICT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
     logger.info(f"Dataset cargado: {df.shape[0]} registros, {df.shape[1]} columnas")
     
     # Inicializar loader
@@ -244,31 +348,43 @@ def load_final_dataset(**context) -> Dict[str, str]:
     
     loader = DataLoader()
     
-    # Guardar en múltiples formatos
+    # Métricas compartidas por Excel, metadatos y el resumen del log
+    stats = loader.compute_stats(df)
+    
+    # Formatos adicionales a Parquet, solo si se piden en params['formats']
+    params = context.get('params', {})
+    formats = params.get('formats') or []
+    
     files_created = {}
     
     try:
-        # Excel (formato principal para análisis)
-        files_created['excel'] = loader.save_to_excel(df, base_filename)
+        # Parquet (formato canónico, siempre se genera)
+        files_created['parquet'] = loader.save_to_parquet(df, base_filename)
         
-        # CSV (formato universal)
-        files_created['csv'] = loader.save_to_csv(df, base_filename)
+        # Excel (análisis manual)
+        if 'excel' in formats:
+            files_created['excel'] = loader.save_to_excel(
+                df, base_filename, stats=stats,
+                include_stats=params.get('excel_stats', False)
+            )
         
-        # Parquet (formato eficiente)
-        files_created['parquet'] = loader.save_to_parquet(df, base_filename)
+        # CSV (formato universal)
+        if 'csv' in formats:
+            files_created['csv'] = loader.save_to_csv(df, base_filename)
         
         # JSON (formato API-friendly)
-        files_created['json'] = loader.save_to_json(df, base_filename)
+        if 'json' in formats:
+            files_created['json'] = loader.save_to_json(df, base_filename)
         
         # Metadatos
-        files_created['metadata'] = loader.create_metadata_file(df, base_filename)
+        files_created['metadata'] = loader.create_metadata_file(df, base_filename, stats=stats)
         
         # Log de resumen
         logger.info("Dataset final creado exitosamente:")
-        logger.info(f"  - Total de registros: {len(df)}")
-        logger.info(f"  - Propiedades con precio: {df['precio_valido'].sum()}")
-        logger.info(f"  - Barrios únicos: {df['barrio'].nunique()}")
-        logger.info(f"  - Calidad promedio: {df['calidad_score'].mean():.1f}/100")
+        logger.info(f"  - Total de registros: {stats['total']}")
+        logger.info(f"  - Propiedades con precio: {stats['precios_validos']}")
+        logger.info(f"  - Barrios únicos: {stats['barrios_unicos']}")
+        logger.info(f"  - Calidad promedio: {stats['calidad_score']['mean']:.1f}/100")
         
         for format_name, filepath in files_created.items():
             logger.info(f"  - {format_name.upper()}: {filepath}")
@@ -290,13 +406,17 @@ def validate_final_dataset(**context) -> bool:
     
     logger.info("Iniciando validación del dataset final")
     
-    # Cargar dataset principal
-    df = pd.read_parquet(files_info['parquet'])
+    # Cargar solo las columnas que usan las validaciones
+    df = pd.read_parquet(files_info['parquet'], columns=_VALIDATION_COLUMNS)
+    
+    # Máscara de precios válidos como array numpy, reutilizada en validaciones y estadísticas
+    valid = df['precio_valido'].to_numpy(dtype=bool, na_value=False)
+    n_valid = int(valid.sum())
     
     # Validaciones críticas
     validations = {
         'total_records': len(df) > 0,
-        'has_valid_prices': df['precio_valido'].sum() > 0,
+        'has_valid_prices': n_valid > 0,
         'has_locations': df['barrio'].notna().sum() > 0,
         'has_links': df['link'].notna().sum() > 0,
         'quality_acceptable': df['calidad_score'].mean() >= 30,  # Al menos 30% de calidad promedio
@@ -312,14 +432,17 @@ def validate_final_dataset(**context) -> bool:
     # Estadísticas finales
     logger.info(f"\nEstadísticas finales del dataset:")
     logger.info(f"  Total de propiedades: {len(df)}")
-    logger.info(f"  Propiedades con precio válido: {df['precio_valido'].sum()} ({df['precio_valido'].mean()*100:.1f}%)")
+    logger.info(f"  Propiedades con precio válido: {n_valid} ({(n_valid / len(df) if len(df) else 0)*100:.1f}%)")
     logger.info(f"  Barrios únicos: {df['barrio'].nunique()}")
     logger.info(f"  Calidad promedio: {df['calidad_score'].mean():.1f}/100")
     
-    if 'precio_numerico' in df.columns and df['precio_valido'].any():
-        precios_validos = df[df['precio_valido'] == True]['precio_numerico']
-        logger.info(f"  Precio promedio: ${precios_validos.mean():,.2f}")
-        logger.info(f"  Rango de precios: ${precios_validos.min():,.2f} - ${precios_validos.max():,.2f}")
+    if 'precio_numerico' in df.columns and n_valid:
+        # Agregados numpy sobre el array filtrado (ignorando nulos, como pandas)
+        precios = df['precio_numerico'].to_numpy(dtype=float, na_value=np.nan)[valid]
+        precios = precios[~np.isnan(precios)]
+        if precios.size:
+            logger.info(f"  Precio promedio: ${precios.mean():,.2f}")
+            logger.info(f"  Rango de precios: ${precios.min():,.2f} - ${precios.max():,.2f}")
     
     # Determinar si la validación es exitosa
     validation_passed = all(validations.values())
@@ -5,25 +5,58 @@ Este módulo contiene las funciones para limpiar y transformar los datos extraí
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import orjson
 import re
-import json
 import logging
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# Expresiones regulares compiladas una sola vez al importar el módulo
+# Precio en una sola pasada: número tras "US"/"USD" (grupo 1) o, si no hay,
+# el primer número del texto (grupo 2)
+_PRICE_RE = re.compile(r'^(?:.*?USD?\s*\$?\s*([\d.,]+)|.*?([\d.,]+))', re.IGNORECASE | re.DOTALL)
+_NUMBER_RE = re.compile(r'[\d.,]+')
+_LOCATION_SEP_RE = re.compile(r'\s*,\s*')
+_ARS_RE = re.compile(r'peso|ars|\$ar', re.IGNORECASE)
+# Número seguido de m², m2, metros o mts, en una sola pasada
+_SURFACE_RE = re.compile(r'([\d.,]+)\s*m(?:[²2]|etros|ts)', re.IGNORECASE)
+# Habitaciones (grupo 1) o baños (grupo 2) en una sola pasada
+_ROOMS_BATHS_RE = re.compile(r'(\d+)\s*(?:amb|dor|hab|cuarto)|(\d+)\s*(?:baño|bath)', re.IGNORECASE)
+
+# Campos de texto crudos que se parsean con operaciones .str
+_TEXT_COLUMNS = ('titulo', 'precio', 'ubicacion', 'habitaciones', 'banos', 'superficie', 'link', 'imagen_url', 'fuente')
+
+# Columnas con pocos valores distintos que se guardan como category
+_CATEGORY_COLUMNS = ('moneda', 'fuente', 'calidad_nivel', 'barrio', 'zona', 'ciudad')
+
+def _parse_number(raw: str) -> Optional[float]:
+    """Convierte '1.234.567,89' / '150.000' a float; None si no es un número"""
+    # Limpiar el número (quitar puntos de miles, convertir comas a puntos)
+    number_str = raw.replace(',', '').replace('.', '')
+    if len(number_str) > 3:  # Si tiene más de 3 dígitos, los últimos 2-3 pueden ser decimales
+        if ',' in raw:  # Si había coma, probablemente son decimales
+            number_str = number_str[:-2] + '.' + number_str[-2:]
+    try:
+        return float(number_str)
+    except ValueError:
+        return None
+
+def _parse_numbers(raw: pd.Series) -> pd.Series:
+    """Versión vectorizada de _parse_number para una columna de strings"""
+    # Sin ningún número en el lote (p.ej. todo "Consultar") la columna es toda NaN y no admite .str
+    if not raw.notna().any():
+        return pd.Series(np.nan, index=raw.index, dtype='float64')
+    digits = raw.str.replace(r'[.,]', '', regex=True)
+    with_decimals = raw.str.contains(',', regex=False, na=False) & digits.str.len().gt(3)
+    digits = digits.mask(with_decimals, digits.str[:-2] + '.' + digits.str[-2:])
+    return pd.to_numeric(digits, errors='coerce')
+
 class DataTransformer:
     """Clase para transformar y limpiar datos de propiedades"""
     
-    def __init__(self):
-        self.price_patterns = {
-            'usd': r'USD?\s*[\$]?\s*([\d.,]+)',
-            'dolares': r'[\$]?\s*([\d.,]+)',
-            'pesos': r'[\$]?\s*([\d.,]+)',
-            'number': r'([\d.,]+)'
-        }
-    
     def clean_price(self, price_str: str) -> Dict[str, Any]:
         """Limpia y extrae información del precio"""
         if not price_str or price_str.lower() in ['consultar', 'consultar precio', 'sin precio']:
@@ -35,25 +68,17 @@ class DataTransformer:
             }
         
         # Determinar moneda
-        moneda = 'USD'
-        if any(word in price_str.lower() for word in ['peso', 'ars', '$ar']):
-            moneda = 'ARS'
+        moneda = 'ARS' if _ARS_RE.search(price_str) else 'USD'
         
         # Extraer número
         precio_numerico = None
-        for pattern_name, pattern in self.price_patterns.items():
-            match = re.search(pattern, price_str, re.IGNORECASE)
-            if match:
-                try:
-                    # Limpiar el número (quitar puntos de miles, convertir comas a puntos)
-                    number_str = match.group(1).replace(',', '').replace('.', '')
-                    if len(number_str) > 3:  # Si tiene más de 3 dígitos, los últimos 2-3 pueden ser decimales
-                        if ',' in match.group(1):  # Si había coma, probablemente son decimales
-                            number_str = number_str[:-2] + '.' + number_str[-2:]
-                    precio_numerico = float(number_str)
-                    break
-                except ValueError:
-                    continue
+        match = _PRICE_RE.match(price_str)
+        if match:
+            usd_number, number = match.groups()
+            precio_numerico = _parse_number(usd_number or number)
+            if precio_numerico is None and usd_number:
+                # Lo que sigue a "USD" no es un número: usar el primero del texto
+                precio_numerico = _parse_number(_NUMBER_RE.search(price_str).group())
         
         return {
             'precio_numerico': precio_numerico,
@@ -68,19 +93,12 @@ class DataTransformer:
             return None
         
         # Buscar números seguidos de m², m2, metros, etc.
-        patterns = [
-            r'([\d.,]+)\s*m[²2]',
-            r'([\d.,]+)\s*metros',
-            r'([\d.,]+)\s*mts'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, superficie_str, re.IGNORECASE)
-            if match:
-                try:
-                    return float(match.group(1).replace(',', '.'))
-                except ValueError:
-                    continue
+        match = _SURFACE_RE.search(superficie_str)
+        if match:
+            try:
+                return float(match.group(1).replace(',', '.'))
+            except ValueError:
+                return None
         
         return None
     
@@ -91,37 +109,15 @@ class DataTransformer:
         if not text:
             return result
         
-        # Patrones para habitaciones/ambientes
-        room_patterns = [
-            r'(\d+)\s*amb',
-            r'(\d+)\s*dor',
-            r'(\d+)\s*hab',
-            r'(\d+)\s*cuarto'
-        ]
-        
-        for pattern in room_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    result['habitaciones'] = int(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        # Patrones para baños
-        bathroom_patterns = [
-            r'(\d+)\s*baño',
-            r'(\d+)\s*bath'
-        ]
-        
-        for pattern in bathroom_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    result['banos'] = int(match.group(1))
-                    break
-                except ValueError:
-                    continue
+        # Primera mención de habitaciones/ambientes y de baños, en un solo recorrido
+        for match in _ROOMS_BATHS_RE.finditer(text):
+            rooms, baths = match.groups()
+            if rooms is not None and result['habitaciones'] is None:
+                result['habitaciones'] = int(rooms)
+            elif baths is not None and result['banos'] is None:
+                result['banos'] = int(baths)
+            if result['habitaciones'] is not None and result['banos'] is not None:
+                break
         
         return result
     
@@ -135,14 +131,14 @@ class DataTransformer:
                 'ciudad': ''
             }
         
-        # Dividir por comas para obtener diferentes niveles
-        parts = [part.strip() for part in location_str.split(',')]
+        # Dividir por comas para obtener diferentes niveles (solo se limpian los usados)
+        parts = location_str.split(',')
         
         return {
             'ubicacion_completa': location_str,
-            'barrio': parts[0] if len(parts) > 0 else '',
-            'zona': parts[1] if len(parts) > 1 else '',
-            'ciudad': parts[-1] if len(parts) > 0 else ''
+            'barrio': parts[0].strip(),
+            'zona': parts[1].strip() if len(parts) > 1 else '',
+            'ciudad': parts[-1].strip()
         }
     
     def validate_property_data(self, property_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -175,84 +171,144 @@ class DataTransformer:
         
         return validation
     
-    def transform_properties_data(self, raw_data: List[Dict[str, Any]]) -> pd.DataFrame:
-        """Transforma la data cruda en un DataFrame limpio y estructurado"""
-        logger.info(f"Iniciando transformación de {len(raw_data)} propiedades")
+    def validate_properties(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Versión vectorizada de validate_property_data para todo el DataFrame"""
+        validation = pd.DataFrame({
+            'tiene_precio': df['precio_valido'].fillna(False).astype(bool),
+            'tiene_ubicacion': df['barrio'].fillna('').ne(''),
+            'tiene_caracteristicas': df[['habitaciones', 'banos', 'superficie_m2']].fillna(0).ne(0).any(axis=1),
+            'tiene_link': df['link'].fillna('').ne(''),
+        }, index=df.index)
         
-        transformed_data = []
+        # Calcular score de calidad (0-100) con aritmética booleana
+        score = (
+            30 * validation['tiene_precio'].astype('int8')
+            + 25 * validation['tiene_ubicacion'].astype('int8')
+            + 25 * validation['tiene_caracteristicas'].astype('int8')
+            + 20 * validation['tiene_link'].astype('int8')
+        ).astype('int8')
         
-        for i, prop in enumerate(raw_data):
-            try:
-                # Limpiar precio
-                price_info = self.clean_price(prop.get('precio', ''))
-                
-                # Limpiar ubicación
-                location_info = self.clean_location(prop.get('ubicacion', ''))
-                
-                # Extraer superficie
-                superficie_m2 = self.extract_surface_area(prop.get('superficie', ''))
-                
-                # Extraer habitaciones y baños
-                rooms_info = self.extract_rooms_bathrooms(
-                    f"{prop.get('habitaciones', '')} {prop.get('banos', '')}"
-                )
-                
-                # Crear registro transformado
-                transformed_prop = {
-                    # Identificación
-                    'id_propiedad': f"prop_{i+1}_{datetime.now().strftime('%Y%m%d')}",
-                    'titulo': prop.get('titulo', '').strip(),
-                    'fuente': prop.get('fuente', 'ArgentProp'),
-                    'link': prop.get('link', ''),
-                    'imagen_url': prop.get('imagen_url', ''),
-                    
-                    # Información de precio
-                    'precio_original': price_info['precio_original'],
-                    'precio_numerico': price_info['precio_numerico'],
-                    'moneda': price_info['moneda'],
-                    'precio_valido': price_info['precio_valido'],
-                    
-                    # Información de ubicación
-                    'ubicacion_completa': location_info['ubicacion_completa'],
-                    'barrio': location_info['barrio'],
-                    'zona': location_info['zona'],
-                    'ciudad': location_info['ciudad'],
-                    
-                    # Características físicas
-                    'habitaciones': rooms_info['habitaciones'],
-                    'banos': rooms_info['banos'],
-                    'superficie_m2': superficie_m2,
-                    
-                    # Metadatos
-                    'fecha_scraping': prop.get('fecha_scraping', datetime.now().isoformat()),
-                    'fecha_transformacion': datetime.now().isoformat()
-                }
-                
-                # Validar calidad de datos
-                validation_info = self.validate_property_data(transformed_prop)
-                transformed_prop.update(validation_info)
-                
-                transformed_data.append(transformed_prop)
-                
-            except Exception as e:
-                logger.error(f"Error transformando propiedad {i}: {e}")
+        validation['calidad_score'] = score
+        validation['calidad_nivel'] = np.select([score >= 80, score >= 50], ['alta', 'media'], default='baja')
+        
+        return validation
+    
+    def transform_properties_data(self, raw_data: Union[pd.DataFrame, pa.Table, List[Dict[str, Any]]]) -> pd.DataFrame:
+        """Transforma la data cruda (DataFrame, tabla Arrow o lista de registros) en un DataFrame limpio y estructurado"""
+        if isinstance(raw_data, pa.Table):
+            raw = raw_data.to_pandas()
+        elif isinstance(raw_data, pd.DataFrame):
+            raw = raw_data
+        else:
+            raw = pd.DataFrame(raw_data)
+        logger.info(f"Iniciando transformación de {len(raw)} propiedades")
+        
+        # Validar entradas una sola vez: descartar filas con campos de texto no string
+        invalid = pd.Series(False, index=raw.index)
+        for col in _TEXT_COLUMNS:
+            if col not in raw.columns:
                 continue
+            values = raw[col]
+            if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+                invalid |= values.notna() & values.str.len().isna()
+            else:
+                invalid |= values.notna()
+        if invalid.any():
+            logger.warning(f"Descartadas {int(invalid.sum())} propiedades con campos de texto inválidos")
+            raw = raw[~invalid]
+        
+        if raw.empty:
+            logger.info("Transformación completada. DataFrame final: (0, 0)")
+            return pd.DataFrame()
+        
+        def text(col: str, default: str = '') -> pd.Series:
+            """Columna de texto cruda, con default si falta la clave o el valor"""
+            if col not in raw.columns:
+                return pd.Series(default, index=raw.index, dtype=object)
+            return raw[col].fillna(default)
+        
+        # Un único instante de transformación compartido por todas las filas
+        now = pd.Timestamp(datetime.now())
+        now_ymd = now.strftime('%Y%m%d')
+        
+        # Precio: moneda y número en operaciones vectorizadas sobre la columna
+        precio = text('precio')
+        sin_precio = precio.eq('') | precio.str.lower().isin(['consultar', 'consultar precio', 'sin precio'])
+        price_parts = precio.str.extract(_PRICE_RE)
+        precio_numerico = _parse_numbers(price_parts[0].fillna(price_parts[1]))
+        # Lo que sigue a "USD" no es un número: usar el primero del texto
+        fallback = precio_numerico.isna() & price_parts[0].notna()
+        if fallback.any():
+            first_number = precio[fallback].str.extract(f'({_NUMBER_RE.pattern})')[0]
+            precio_numerico[fallback] = _parse_numbers(first_number)
+        precio_numerico = precio_numerico.mask(sin_precio)
+        moneda = pd.Series(np.where(precio.str.contains(_ARS_RE), 'ARS', 'USD'), index=raw.index)
+        
+        # Ubicación: barrio, zona y ciudad a partir de las partes separadas por coma
+        ubicacion = text('ubicacion')
+        # Separador con espacios incluidos: las partes salen ya limpias
+        location_parts = ubicacion.str.strip().str.split(_LOCATION_SEP_RE)
         
-        # Crear DataFrame
-        df = pd.DataFrame(transformed_data)
+        # Características físicas: primera mención de cada tipo en un solo extractall
+        features = text('habitaciones') + ' ' + text('banos')
+        rooms_baths = (
+            features.str.extractall(_ROOMS_BATHS_RE)
+            .groupby(level=0).first()
+            .reindex(raw.index)
+        )
         
-        # Optimizar tipos de datos
-        if not df.empty:
-            # Convertir a tipos apropiados
-            df['precio_numerico'] = pd.to_numeric(df['precio_numerico'], errors='coerce')
-            df['superficie_m2'] = pd.to_numeric(df['superficie_m2'], errors='coerce')
-            df['habitaciones'] = pd.to_numeric(df['habitaciones'], errors='coerce').astype('Int64')
-            df['banos'] = pd.to_numeric(df['banos'], errors='coerce').astype('Int64')
-            df['calidad_score'] = pd.to_numeric(df['calidad_score'], errors='coerce')
+        df = pd.DataFrame({
+            # Identificación
+            'id_propiedad': 'prop_' + pd.Series(np.arange(1, len(raw) + 1), index=raw.index).astype(str) + f'_{now_ymd}',
+            'titulo': text('titulo').str.strip(),
+            'fuente': text('fuente', 'ArgentProp'),
+            'link': text('link'),
+            'imagen_url': text('imagen_url'),
             
-            # Convertir fechas
-            df['fecha_scraping'] = pd.to_datetime(df['fecha_scraping'])
-            df['fecha_transformacion'] = pd.to_datetime(df['fecha_transformacion'])
+            # Información de precio
+            'precio_original': precio,
+            'precio_numerico': precio_numerico,
+            'moneda': moneda.mask(sin_precio),
+            'precio_valido': precio_numerico.notna(),
+            
+            # Información de ubicación
+            'ubicacion_completa': ubicacion,
+            'barrio': location_parts.str[0],
+            'zona': location_parts.str[1].fillna(''),
+            'ciudad': location_parts.str[-1],
+            
+            # Características físicas
+            'habitaciones': pd.to_numeric(rooms_baths[0], errors='coerce'),
+            'banos': pd.to_numeric(rooms_baths[1], errors='coerce'),
+            'superficie_m2': pd.to_numeric(
+                text('superficie').str.extract(_SURFACE_RE)[0].str.replace(',', '.', regex=False),
+                errors='coerce'
+            ),
+            
+            # Metadatos
+            'fecha_scraping': raw['fecha_scraping'] if 'fecha_scraping' in raw.columns else now,
+            'fecha_transformacion': now
+        })
+        
+        # Validar calidad de datos
+        df = pd.concat([df, self.validate_properties(df)], axis=1)
+        
+        # Optimizar tipos de datos (enteros chicos y float32 donde alcanza la precisión)
+        # Int16 cubre cualquier conteo real; valores fuera de rango (avisos mal cargados)
+        # quedan como <NA> en lugar de abortar la transformación
+        for col in ('habitaciones', 'banos'):
+            df[col] = df[col].where(df[col].between(0, np.iinfo(np.int16).max)).astype('Int16')
+        df['superficie_m2'] = df['superficie_m2'].astype('float32')
+        # El precio queda siempre en float64: float32 pierde precisión por encima de ~1e7
+        # (precios en pesos) y el esquema del Parquet tiene que ser el mismo en todas las corridas
+        df['precio_numerico'] = df['precio_numerico'].astype('float64')
+        
+        # Texto de baja cardinalidad como categórico (códigos enteros + diccionario)
+        for col in _CATEGORY_COLUMNS:
+            df[col] = df[col].astype('category')
+        
+        # Convertir fechas (fecha_transformacion ya es un Timestamp)
+        df['fecha_scraping'] = pd.to_datetime(df['fecha_scraping'])
         
         logger.info(f"Transformación completada. DataFrame final: {df.shape}")
         return df
@@ -268,9 +324,13 @@ def transform_properties_data(**context) -> str:
     
     logger.info(f"Iniciando transformación de datos desde: {raw_data_path}")
     
-    # Cargar datos raw
-    with open(raw_data_path, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
+    # Cargar datos raw (Parquet; los checkpoints JSON anteriores se leen con orjson)
+    if raw_data_path.endswith('.json'):
+        with open(raw_data_path, 'rb') as f:
+            raw_data = pd.DataFrame(orjson.loads(f.read()))
+    else:
+        # Directo a DataFrame, sin pasar por una lista de dicts
+        raw_data = pd.read_parquet(raw_data_path)
     
     logger.info(f"Cargados {len(raw_data)} registros para transformar")
     
@@ -1,50 +1,106 @@
-from flask import Flask, request, jsonify, render_template
-from bs4 import BeautifulSoup
+from flask import Flask, Response, request, jsonify, render_template
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 
 app = Flask(__name__)
 
+# Sesión compartida: keep-alive entre páginas y requests, respuestas comprimidas
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'Accept-Encoding': 'gzip, deflate',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+
+def _has_class(name):
+    """Predicado XPath equivalente a class_=name de BeautifulSoup"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Selectores compilados una sola vez
+_XP_PROPS = etree.XPath(f"//div[{_has_class('listing__item')}]")
+_XP_LINK = etree.XPath("(.//a)[1]")
+_XP_TITLE = etree.XPath(f"(.//h2[{_has_class('card__title')}])[1]")
+_XP_PRICE = etree.XPath(f"(.//p[{_has_class('card__price')}])[1]")
+_XP_ADDRESS = etree.XPath(f"(.//p[{_has_class('card__address')}])[1]")
+
+_COLUMNS = ['Nombre', 'Precio', 'Dirección', 'Link']
+
+# Caché en memoria de páginas descargadas: url -> (vencimiento, html)
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_MAXSIZE = 256
+_page_cache = {}
+_page_cache_lock = threading.Lock()
+
+def _fetch_page(url):
+    """Descarga una página, reutilizando la respuesta si se pidió hace menos de PAGE_CACHE_TTL segundos"""
+    now = time.monotonic()
+    with _page_cache_lock:
+        cached = _page_cache.get(url)
+        if cached and cached[0] > now:
+            return cached[1]
+    
+    response = _SESSION.get(url, timeout=10)
+    if not response.ok:
+        return response.text
+    
+    html = response.text
+    with _page_cache_lock:
+        if len(_page_cache) >= PAGE_CACHE_MAXSIZE:
+            # Purgar las vencidas y, si sigue lleno, la más antigua
+            for key in [key for key, (expires, _) in _page_cache.items() if expires <= now]:
+                del _page_cache[key]
+            if len(_page_cache) >= PAGE_CACHE_MAXSIZE:
+                del _page_cache[next(iter(_page_cache))]
+        _page_cache[url] = (now + PAGE_CACHE_TTL, html)
+    return html
+
+def _text_or(found, default):
+    """Texto del primer elemento encontrado (como .text.strip()) o el valor por defecto"""
+    if found:
+        return ''.join(found[0].itertext()).strip()
+    return default
+
 def scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by):
-    current_page = 1
-    data = []
+    # Una lista por columna: el DataFrame se arma una sola vez al final
+    nombres, precios, direcciones, links = [], [], [], []
+    # Prefijo invariante: sólo cambia el número de página
+    base = f'https://www.argenprop.com/{property_type}/{operation_type}/{location}?{price_range_from}-{price_range_to}-{currency}&orden-{sort_by}&pagina-'
+    urls = [base + str(current_page) for current_page in range(1, max_pages + 1)]
+    if not urls:
+        return pd.DataFrame(columns=_COLUMNS)
 
-    while current_page <= max_pages:
-        url = f'https://www.argenprop.com/{property_type}/{operation_type}/{location}?{price_range_from}-{price_range_to}-{currency}&orden-{sort_by}&pagina-{str(current_page)}'
-        response = requests.get(url, timeout=10).text
-        doc = BeautifulSoup(response, 'html.parser')
+    # Descargar todas las páginas en paralelo reutilizando las conexiones de la sesión
+    with ThreadPoolExecutor(max_workers=min(8, len(urls))) as executor:
+        pages = list(executor.map(_fetch_page, urls))
+
+    for response in pages:
+        doc = etree.HTML(response)
+        if doc is None:
+            continue
         
-        all_props = doc.find_all('div', class_= 'listing__item')
+        all_props = _XP_PROPS(doc)
         
         for prop in all_props:
-            item = {}
-            
-            link = prop.find('a')
-            if link:
-                title = link.find('h2', class_= 'card__title')
-                if title:
-                    item['Nombre'] = title.text.strip()
-                else:
-                    item['Nombre'] = 'No title available'
-                
-                price = link.find('p', class_='card__price')
-                if price:
-                    item['Precio'] = price.text.strip()
-                else:
-                    item['Precio'] = 'No price available'
-                    
-                address = link.find('p', class_='card__address')
-                if address:
-                    item['Dirección'] = address.text.strip()
-                else:
-                    item['Dirección'] = 'No address available'
-                
-                item['Link'] = 'https://www.argenprop.com' + link['href']
-
-                data.append(item)
-                
-        current_page += 1
-    return data
+            found = _XP_LINK(prop)
+            if found:
+                link = found[0]
+                href = link.attrib['href']
+                nombres.append(_text_or(_XP_TITLE(link), 'No title available'))
+                precios.append(_text_or(_XP_PRICE(link), 'No price available'))
+                direcciones.append(_text_or(_XP_ADDRESS(link), 'No address available'))
+                links.append('https://www.argenprop.com' + href)
+
+    return pd.DataFrame(dict(zip(_COLUMNS, (nombres, precios, direcciones, links))))
 
 @app.route('/scrape', methods=['GET'])
 def scrape():
@@ -62,7 +118,8 @@ def scrape():
 
     data = scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by)
 
-    return jsonify(data)
+    # Serializar el DataFrame directo a un array JSON de registros
+    return Response(data.to_json(orient='records', force_ascii=False), mimetype='application/json')
 
 @app.route('/')
 def index():
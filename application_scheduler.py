@@ -1,15 +1,28 @@
-from flask import Flask, request, jsonify, render_template
-from bs4 import BeautifulSoup
+from flask import Flask, Response, request, jsonify, render_template
+import orjson
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import xlsxwriter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ProcessPoolExecutor as ApsProcessPool
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from datetime import datetime
 import os
+import atexit
+import multiprocessing
+import hashlib
 import logging
+import threading
+import time
+import random
 
 # Importa el manager de Google Sheets
 try:
-    from google_sheets_config import GoogleSheetsManager
+    from google_sheets_config import get_sheets_manager
     GOOGLE_SHEETS_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ Google Sheets no disponible: {e}")
@@ -18,6 +31,10 @@ except ImportError as e:
 
 app = Flask(__name__)
 
+def json_response(payload, status=200):
+    """Respuesta JSON serializada con orjson (más rápido que jsonify)"""
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -31,56 +48,188 @@ DEFAULT_CONFIG = {
     'price_range_to': 200000,
     'currency': 'dolares',
     'max_pages': 3,
-    'sort_by': 'masnuevos'
+    'sort_by': 'masnuevos',
+    'max_workers': 8  # Páginas descargadas en simultáneo
 }
 
-def scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by):
-    current_page = 1
-    data = []
+# Sesión HTTP compartida por páginas y corridas (una por proceso: el job programado
+# corre en el pool de procesos y no debe heredar sockets abiertos del padre)
+_session = None
+_session_pid = None
 
-    while current_page <= max_pages:
-        try:
-            url = f'https://www.argenprop.com/{property_type}/{operation_type}/{location}?{price_range_from}-{price_range_to}-{currency}&orden-{sort_by}&pagina-{str(current_page)}'
-            response = requests.get(url, timeout=10).text
-            doc = BeautifulSoup(response, 'html.parser')
-            
-            all_props = doc.find_all('div', class_= 'listing__item')
-            
-            for prop in all_props:
-                item = {}
-                
-                link = prop.find('a')
-                if link:
-                    title = link.find('h2', class_= 'card__title')
-                    if title:
-                        item['Nombre'] = title.text.strip()
-                    else:
-                        item['Nombre'] = 'No title available'
-                    
-                    price = link.find('p', class_='card__price')
-                    if price:
-                        item['Precio'] = price.text.strip()
-                    else:
-                        item['Precio'] = 'No price available'
-                        
-                    address = link.find('p', class_='card__address')
-                    if address:
-                        item['Dirección'] = address.text.strip()
-                    else:
-                        item['Dirección'] = 'No address available'
-                    
-                    item['Link'] = 'https://www.argenprop.com' + link['href']
-                    item['Fecha_Scraping'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+def get_session():
+    """Devuelve la sesión keep-alive del proceso actual, creándola si hace falta"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        session = requests.Session()
+        session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        })
+        session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
+        _session, _session_pid = session, os.getpid()
+    return _session
 
-                    data.append(item)
-                    
-        except Exception as e:
-            logger.error(f"Error scraping page {current_page}: {str(e)}")
+def _has_class(name):
+    """Predicado XPath equivalente a class_=name de BeautifulSoup"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Selectores compilados una sola vez
+_XP_PROPS = etree.XPath(f"//div[{_has_class('listing__item')}]")
+_XP_LINK = etree.XPath("(.//a)[1]")
+_XP_TITLE = etree.XPath(f"(.//h2[{_has_class('card__title')}])[1]")
+_XP_PRICE = etree.XPath(f"(.//p[{_has_class('card__price')}])[1]")
+_XP_ADDRESS = etree.XPath(f"(.//p[{_has_class('card__address')}])[1]")
+
+def _text_or(found, default):
+    """Texto del primer elemento encontrado (como .text.strip()) o el valor por defecto"""
+    if found:
+        return ''.join(found[0].itertext()).strip()
+    return default
+
+# Caché en memoria de páginas descargadas: url -> (vencimiento, (bytes, charset))
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_MAXSIZE = 256
+_page_cache = {}
+_page_cache_lock = threading.Lock()
+
+def fetch_page(session, url):
+    """
+    Descarga una página, reutilizando la respuesta si se pidió hace menos de PAGE_CACHE_TTL segundos.
+    Returns: (cuerpo en bytes, charset declarado por el servidor o None)
+    """
+    now = time.monotonic()
+    with _page_cache_lock:
+        cached = _page_cache.get(url)
+        if cached and cached[0] > now:
+            return cached[1]
+    
+    # Pequeño jitter para no llegar al sitio con todas las páginas a la vez
+    time.sleep(random.uniform(0, 0.5))
+    response = session.get(url, timeout=10)
+    # Bytes crudos para lxml: sin la detección de charset ni la decodificación de .text
+    charset = response.encoding if 'charset' in response.headers.get('Content-Type', '').lower() else None
+    html = (response.content, charset)
+    if not response.ok:
+        return html
+    
+    with _page_cache_lock:
+        if len(_page_cache) >= PAGE_CACHE_MAXSIZE:
+            # Purgar las vencidas y, si sigue lleno, la más antigua
+            for key in [key for key, (expires, _) in _page_cache.items() if expires <= now]:
+                del _page_cache[key]
+            if len(_page_cache) >= PAGE_CACHE_MAXSIZE:
+                del _page_cache[next(iter(_page_cache))]
+        _page_cache[url] = (now + PAGE_CACHE_TTL, html)
+    return html
+
+# Valores aceptados por los endpoints de scraping
+_PROPERTY_TYPES = frozenset({'departamentos', 'casas'})
+_OPERATION_TYPES = frozenset({'venta', 'alquiler'})
+_SORT_BY = frozenset({'masnuevos', 'menorprecio', 'mayorprecio'})
+_CURRENCY = frozenset({'dolares', 'pesos'})
+
+# Columnas de cada propiedad scrapeada
+PROPERTY_COLUMNS = ['Nombre', 'Precio', 'Dirección', 'Link', 'Fecha_Scraping']
+
+def parse_page(body, charset, scrape_ts):
+    """Parsea el HTML de una página y devuelve sus propiedades (función pura, corre en el pool de procesos)"""
+    data = []
+    # Sin charset en el header, lxml lo detecta del <meta> del documento
+    doc = etree.HTML(body, etree.HTMLParser(encoding=charset) if charset else None)
+    if doc is None:
+        return data
+    
+    all_props = _XP_PROPS(doc)
+    
+    for prop in all_props:
+        item = {}
         
-        current_page += 1
+        links = _XP_LINK(prop)
+        if links:
+            link = links[0]
+            item['Nombre'] = _text_or(_XP_TITLE(link), 'No title available')
+            item['Precio'] = _text_or(_XP_PRICE(link), 'No price available')
+            item['Dirección'] = _text_or(_XP_ADDRESS(link), 'No address available')
+            item['Link'] = 'https://www.argenprop.com' + link.attrib['href']
+            item['Fecha_Scraping'] = scrape_ts
+
+            data.append(item)
     
     return data
 
+# Pool de parseo compartido por todas las corridas del proceso (levantar procesos e
+# importar lxml/pandas cuesta más que parsear unas pocas páginas)
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    """
+    Devuelve el pool de procesos de parseo, creándolo la primera vez.
+    Returns: None en procesos hijos (workers de APScheduler): ahí no corre atexit y
+    un pool propio dejaría colgado al worker, así que se parsea en el thread de descarga
+    """
+    global _parse_pool
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            atexit.register(_parse_pool.shutdown)
+    return _parse_pool
+
+def scrape_page(session, parse_pool, url, current_page, scrape_ts):
+    """Descarga una página y parsea en el pool de procesos (o en el thread si no hay pool); lista vacía si falla"""
+    try:
+        body, charset = fetch_page(session, url)
+        if parse_pool is None:
+            # lxml libera el GIL mientras parsea: los threads de descarga se superponen igual
+            return parse_page(body, charset, scrape_ts)
+        return parse_pool.submit(parse_page, body, charset, scrape_ts).result()
+    except Exception as e:
+        logger.error(f"Error scraping page {current_page}: {str(e)}")
+        return []
+
+def scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by, max_workers=8):
+    data = []
+    # Prefijo invariante: sólo cambia el número de página
+    base = f'https://www.argenprop.com/{property_type}/{operation_type}/{location}?{price_range_from}-{price_range_to}-{currency}&orden-{sort_by}&pagina-'
+    urls = [base + str(current_page) for current_page in range(1, max_pages + 1)]
+    if not urls:
+        return data
+
+    # Cada worker descarga y parsea su página: el parseo se superpone con otras descargas
+    session = get_session()
+    # Una sola marca de tiempo para todas las propiedades de la corrida
+    scrape_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    parse_pool = get_parse_pool()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+        pages = executor.map(
+            scrape_page, [session] * len(urls), [parse_pool] * len(urls), urls,
+            range(1, len(urls) + 1), [scrape_ts] * len(urls)
+        )
+        for page_data in pages:
+            data.extend(page_data)
+    
+    return data
+
+# Directorio de resultados: se crea una sola vez al importar el módulo
+RESULTS_DIR = 'resultados'
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+def write_excel_columns(df, filepath, sheet_name='Scraping'):
+    """Escribe el DataFrame con xlsxwriter columna por columna (acepta ruta o archivo abierto)"""
+    values = df.astype(object).where(df.notna(), None)
+    with xlsxwriter.Workbook(filepath) as wb:
+        ws = wb.add_worksheet(sheet_name)
+        ws.write_row(0, 0, list(df.columns))
+        for col_idx, col in enumerate(values.columns):
+            ws.write_column(1, col_idx, values[col].tolist())
+
 def save_to_excel_and_sheets(data, filename=None, config=None):
     """Guarda los datos en Excel local y Google Sheets"""
     if not data:
@@ -91,29 +240,35 @@ def save_to_excel_and_sheets(data, filename=None, config=None):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'scraping_results_{timestamp}.xlsx'
     
-    # Crear directorio de resultados si no existe
-    results_dir = 'resultados'
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
-    
-    filepath = os.path.join(results_dir, filename)
+    filepath = os.path.join(RESULTS_DIR, filename)
     excel_success = False
     sheets_url = None
     
     try:
-        df = pd.DataFrame(data)
+        # Columnas conocidas y todo texto: sin inferencia de tipos ni alineación por fila
+        df = pd.DataFrame.from_records(data, columns=PROPERTY_COLUMNS).astype('string')
         
-        # 1. Guardar en Excel local
+        # 1. Guardar en archivo local
         try:
-            # Si el archivo ya existe, agregar los datos como una nueva hoja
-            if os.path.exists(filepath):
-                with pd.ExcelWriter(filepath, mode='a', engine='openpyxl', if_sheet_exists='new') as writer:
-                    sheet_name = f'Scraping_{datetime.now().strftime("%Y%m%d_%H%M")}'
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            if filepath.endswith('.parquet'):
+                # Un archivo por corrida: no hay que releer ni reescribir lo anterior
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                df.to_parquet(filepath, index=False, compression='snappy')
+            elif filepath.endswith('.csv'):
+                df.to_csv(filepath, index=False, encoding='utf-8')
             else:
-                df.to_excel(filepath, index=False)
+                # Apertura exclusiva: si el archivo ya existe, la corrida va a uno nuevo con hora
+                # en el nombre (sin stat() previo ni reescritura del libro en modo append)
+                try:
+                    f = open(filepath, 'xb')
+                except FileExistsError:
+                    root, ext = os.path.splitext(filepath)
+                    filepath = f'{root}_{datetime.now().strftime("%H%M%S%f")}{ext}'
+                    f = open(filepath, 'xb')
+                with f:
+                    write_excel_columns(df, f)
             
-            logger.info(f"📁 Datos guardados en Excel local: {filepath}")
+            logger.info(f"📁 Datos guardados en archivo local: {filepath}")
             excel_success = True
             
         except Exception as e:
@@ -124,8 +279,8 @@ def save_to_excel_and_sheets(data, filename=None, config=None):
             try:
                 logger.info("☁️ Intentando guardar en Google Sheets...")
                 
-                # Crear manager de Google Sheets
-                sheets_manager = GoogleSheetsManager()
+                # Manager de Google Sheets (autenticado una sola vez por proceso)
+                sheets_manager = get_sheets_manager()
                 
                 # Determinar nombre de la hoja
                 if config:
@@ -159,18 +314,52 @@ def save_to_excel(data, filename=None):
     filepath, _ = save_to_excel_and_sheets(data, filename)
     return filepath
 
-def scheduled_scraping():
-    """Función que se ejecuta automáticamente cada día"""
+# Formatos de archivo local soportados -> extensión
+DATASET_FORMATS = {'parquet': 'parquet', 'csv': 'csv', 'xlsx': 'xlsx'}
+
+def save_dataset(data, fmt='parquet', config=None):
+    """Guarda los datos en el formato local pedido (Parquet por defecto) y en Google Sheets"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'scraping_results_{timestamp}.{DATASET_FORMATS[fmt]}'
+    return save_to_excel_and_sheets(data, filename, config)
+
+LAST_HASH_FILE = os.path.join(RESULTS_DIR, '.last_hash')
+
+def data_digest(data):
+    """Hash del contenido (Link, Precio) para detectar corridas sin cambios"""
+    lines = sorted(f"{d['Link']}|{d['Precio']}" for d in data)
+    return hashlib.blake2b('\n'.join(lines).encode(), digest_size=16).hexdigest()
+
+def scheduled_scraping(config=None):
+    """Función que se ejecuta automáticamente cada día (en un proceso aparte)"""
     logger.info("🤖 Iniciando scraping programado...")
     
+    # La configuración llega como argumento: el proceso del job no ve los cambios globales
+    config = config or DEFAULT_CONFIG
+    
     try:
-        data = scrape_props(**DEFAULT_CONFIG)
+        data = scrape_props(**config)
         
         if data:
-            filename = f'scraping_diario_{datetime.now().strftime("%Y%m%d")}.xlsx'
-            filepath, sheets_url = save_to_excel_and_sheets(data, filename, DEFAULT_CONFIG)
+            # Si los avisos no cambiaron desde la última corrida no hay nada nuevo que guardar
+            digest = data_digest(data)
+            try:
+                with open(LAST_HASH_FILE) as f:
+                    last_digest = f.read().strip()
+            except OSError:
+                last_digest = None
+            if digest == last_digest:
+                logger.info(f"⏭️ Sin cambios desde la última corrida ({len(data)} propiedades), no se guarda")
+                return
+            
+            # Dump diario particionado por fecha (Parquet) en vez de acumular hojas en un .xlsx
+            now = datetime.now()
+            filename = os.path.join(f'date={now.strftime("%Y%m%d")}', f'run-{now.strftime("%H%M%S")}.parquet')
+            filepath, sheets_url = save_to_excel_and_sheets(data, filename, config)
             
             if filepath or sheets_url:
+                with open(LAST_HASH_FILE, 'w') as f:
+                    f.write(digest)
                 logger.info(f"🎉 Scraping completado. {len(data)} propiedades encontradas")
                 if filepath:
                     logger.info(f"📁 Archivo local: {filepath}")
@@ -195,16 +384,16 @@ def scrape():
     max_pages = request.args.get('max_pages', type=int)
     sort_by = request.args.get('sort_by', type=str)
 
-    if property_type not in ['departamentos', 'casas'] or operation_type not in ['venta', 'alquiler'] or sort_by not in ['masnuevos', 'menorprecio', 'mayorprecio'] or currency not in ['dolares', 'pesos']:
+    if property_type not in _PROPERTY_TYPES or operation_type not in _OPERATION_TYPES or sort_by not in _SORT_BY or currency not in _CURRENCY:
         return jsonify({"error": "Invalid input."}), 400
 
     data = scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by)
 
-    return jsonify(data)
+    return json_response(data)
 
 @app.route('/scrape_and_save', methods=['GET'])
 def scrape_and_save():
-    """Endpoint para hacer scraping y guardar en Excel"""
+    """Endpoint para hacer scraping y guardar en archivo local (Parquet, CSV o Excel)"""
     property_type = request.args.get('property_type', DEFAULT_CONFIG['property_type'])
     operation_type = request.args.get('operation_type', DEFAULT_CONFIG['operation_type'])
     location = request.args.get('location', DEFAULT_CONFIG['location'])
@@ -213,15 +402,17 @@ def scrape_and_save():
     currency = request.args.get('currency', DEFAULT_CONFIG['currency'])
     max_pages = request.args.get('max_pages', DEFAULT_CONFIG['max_pages'], type=int)
     sort_by = request.args.get('sort_by', DEFAULT_CONFIG['sort_by'])
+    # Formato del archivo local: parquet (default), csv o xlsx
+    fmt = request.args.get('format', 'parquet')
 
-    if property_type not in ['departamentos', 'casas'] or operation_type not in ['venta', 'alquiler'] or sort_by not in ['masnuevos', 'menorprecio', 'mayorprecio'] or currency not in ['dolares', 'pesos']:
+    if property_type not in _PROPERTY_TYPES or operation_type not in _OPERATION_TYPES or sort_by not in _SORT_BY or currency not in _CURRENCY or fmt not in DATASET_FORMATS:
         return jsonify({"error": "Invalid input."}), 400
 
     try:
         data = scrape_props(property_type, operation_type, location, price_range_from, price_range_to, currency, max_pages, sort_by)
         
         if data:
-            filepath = save_to_excel(data)
+            filepath, _ = save_dataset(data, fmt)
             return jsonify({
                 "success": True,
                 "message": f"Scraping completado. {len(data)} propiedades encontradas.",
@@ -249,9 +440,14 @@ def config():
         # Actualizar configuración
         new_config = request.get_json()
         DEFAULT_CONFIG.update(new_config)
-        return jsonify({"success": True, "message": "Configuración actualizada", "config": DEFAULT_CONFIG})
+        # El job corre en otro proceso: actualizar la configuración que recibe
+        try:
+            scheduler.modify_job('daily_scraping', args=[dict(DEFAULT_CONFIG)])
+        except NameError:
+            pass  # Scheduler no iniciado (app importada como módulo)
+        return json_response({"success": True, "message": "Configuración actualizada", "config": DEFAULT_CONFIG})
     
-    return jsonify(DEFAULT_CONFIG)
+    return json_response(DEFAULT_CONFIG)
 
 @app.route('/')
 def index():
@@ -270,26 +466,34 @@ def status():
                 "next_run": job.next_run_time.strftime('%Y-%m-%d %H:%M:%S') if job.next_run_time else None
             })
         
-        return jsonify({
+        return json_response({
             "scheduler_running": scheduler.running,
             "jobs": job_info,
             "current_config": DEFAULT_CONFIG
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}, 500)
 
 if __name__ == "__main__":
-    # Configurar el scheduler
-    scheduler = BackgroundScheduler()
+    # Configurar el scheduler: el scraping corre en un pool de procesos para no frenar a Flask
+    # Jobs persistidos en SQLite: al reiniciar no se pierde el estado ni se repiten corridas
+    scheduler = BackgroundScheduler(
+        jobstores={'default': SQLAlchemyJobStore(url='sqlite:///jobs.sqlite')},
+        executors={'default': ApsProcessPool(2)},
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 3600}
+    )
     
     # Programar el scraping diario a las 9:00 AM
     scheduler.add_job(
         func=scheduled_scraping,
+        args=[dict(DEFAULT_CONFIG)],
+        executor='default',
         trigger="cron",
         hour=9,
         minute=0,
         id='daily_scraping',
-        name='Scraping Diario de Propiedades'
+        name='Scraping Diario de Propiedades',
+        replace_existing=True
     )
     
     # Iniciar el scheduler
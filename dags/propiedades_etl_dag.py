@@ -47,7 +47,12 @@ SCRAPING_CONFIG = {
     'price_range_to': 300000,
     'currency': 'dolares',
     'max_pages': 10,
-    'sort_by': 'masnuevos'
+    'max_workers': 4,
+    'sort_by': 'masnuevos',
+    # Formatos extra además de Parquet: 'excel', 'csv', 'json'
+    'formats': [],
+    # Hojas de estadísticas y calidad en el Excel (solo si se pide 'excel')
+    'excel_stats': False,
 }
 
 # Definición del DAG
@@ -84,7 +89,7 @@ de ArgentProp, uno de los portales inmobiliarios más importantes de Argentina.
 - Scraping web de ArgentProp
 - Extracción de metadatos de propiedades
 - Manejo de rate limiting y errores
-- Almacenamiento temporal en JSON
+- Almacenamiento temporal en Parquet
 
 ### 2. Transformación (Transform)
 - Limpieza y normalización de datos
@@ -114,11 +119,14 @@ de ArgentProp, uno de los portales inmobiliarios más importantes de Argentina.
 - Reportes automáticos de calidad
 
 ### Formatos de Salida
-- **Excel**: Para análisis manual
-- **CSV**: Compatibilidad universal
-- **Parquet**: Eficiencia en big data
-- **JSON**: Integración con APIs
-- **Metadata**: Documentación automática
+- **Parquet**: Eficiencia en big data (siempre)
+- **Metadata**: Documentación automática (siempre)
+- **Excel**: Para análisis manual (opcional)
+- **CSV**: Compatibilidad universal (opcional)
+- **JSON**: NDJSON para integración con APIs (opcional)
+
+Los formatos opcionales se activan con el parámetro `formats`,
+por ejemplo `{"formats": ["excel", "csv", "json"]}` al disparar el DAG.
 
 ## Monitoreo y Alertas
 - Logs detallados en cada etapa
@@ -243,6 +251,7 @@ Esta task realiza el web scraping de ArgentProp para extraer datos de propiedade
 - **location**: Ubicación geográfica
 - **price_range**: Rango de precios a filtrar
 - **max_pages**: Número máximo de páginas a scrapear
+- **max_workers**: Páginas descargadas en simultáneo (límite de cortesía con el sitio)
 
 ### Datos Extraídos:
 - Título de la propiedad
@@ -254,7 +263,7 @@ Esta task realiza el web scraping de ArgentProp para extraer datos de propiedade
 - Fecha de scraping
 
 ### Salida:
-Archivo JSON con datos crudos en `/tmp/raw_properties_TIMESTAMP.json`
+Archivo Parquet (zstd) con datos crudos en `/tmp/raw_properties_TIMESTAMP.parquet`
 """
 
 transform_task.doc_md = """
@@ -282,14 +291,14 @@ Archivo Parquet con datos transformados en `/tmp/transformed_properties_TIMESTAM
 load_task.doc_md = """
 ## Task: Carga del Dataset
 
-Esta task genera el dataset final en múltiples formatos.
+Esta task genera el dataset final en Parquet y, a pedido, en otros formatos.
 
 ### Formatos Generados:
-- **Excel**: Incluye hojas de estadísticas y calidad
-- **CSV**: Formato universal para análisis
-- **Parquet**: Formato eficiente para big data
-- **JSON**: Para integración con APIs
-- **Metadata**: Documentación del dataset
+- **Parquet**: Formato eficiente para big data (siempre)
+- **Metadata**: Documentación del dataset (siempre)
+- **Excel**: Datos, y hojas de estadísticas y calidad con `excel_stats` (si `formats` incluye `excel`)
+- **CSV**: Formato universal para análisis (si `formats` incluye `csv`)
+- **JSON**: NDJSON (`.jsonl`) para integración con APIs (si `formats` incluye `json`)
 
 ### Reportes Incluidos:
 - Estadísticas descriptivas
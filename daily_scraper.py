@@ -4,17 +4,32 @@ Se puede ejecutar desde el Programador de tareas de Windows
 Guarda los resultados en Google Sheets (Excel de Drive)
 """
 
-from bs4 import BeautifulSoup
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook, load_workbook
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
+import re
+import pickle
+import zipfile
+import itertools
+import numbers
+from xml.sax.saxutils import escape
 import logging
+import logging.handlers
+import queue
+import atexit
 import sys
 
 # Importa el manager de Google Sheets
 try:
-    from google_sheets_config import GoogleSheetsManager
+    from google_sheets_config import get_sheets_manager
     GOOGLE_SHEETS_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ Google Sheets no disponible: {e}")
@@ -30,13 +45,27 @@ def setup_logging():
     log_filename = f'scraping_{datetime.now().strftime("%Y%m%d")}.log'
     log_filepath = os.path.join(log_dir, log_filename)
     
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.FileHandler(log_filepath),
+        logging.StreamHandler(sys.stdout)
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Los threads de scraping sólo encolan los registros; la escritura a disco/consola
+    # la hace un thread en segundo plano
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    # El formato lo aplican los handlers del listener: el QueueHandler deja sólo el mensaje
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filepath),
-            logging.StreamHandler(sys.stdout)
-        ]
+        handlers=[queue_handler]
     )
     return logging.getLogger(__name__)
 
@@ -49,9 +78,90 @@ SCRAPING_CONFIG = {
     'price_range_to': 200000,               # precio máximo
     'currency': 'dolares',                   # dolares, pesos
     'max_pages': 5,                          # número máximo de páginas a scrapear
-    'sort_by': 'masnuevos'                  # masnuevos, menorprecio, mayorprecio
+    'sort_by': 'masnuevos',                 # masnuevos, menorprecio, mayorprecio
+    'max_workers': 8                         # páginas descargadas en paralelo
 }
 
+def _has_class(name):
+    """Predicado XPath equivalente a class_=name de BeautifulSoup"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# XPaths compiladas una sola vez: se evalúan en C, sin recorrer el árbol desde Python
+_XP_PROPS = etree.XPath(f"//div[{_has_class('listing__item')}]")
+_XP_LINK = etree.XPath("(.//a)[1]")
+_XP_TITLE = etree.XPath(f"(.//h2[{_has_class('card__title')}])[1]")
+_XP_PRICE = etree.XPath(f"(.//p[{_has_class('card__price')}])[1]")
+_XP_ADDRESS = etree.XPath(f"(.//p[{_has_class('card__address')}])[1]")
+
+def _text_or(found, default):
+    """Texto del primer elemento encontrado (como .text.strip()) o el valor por defecto"""
+    if found:
+        return ''.join(found[0].itertext()).strip()
+    return default
+
+# Regex de precios compiladas una sola vez (separadores de miles y primer número)
+_PRICE_SEP_RE = re.compile(r'[.,]')
+_PRICE_RE = re.compile(r'(\d+)')
+
+# Sesión HTTP compartida: keep-alive y pool de conexiones para todas las páginas.
+# Como máximo MAX_CONNECTIONS pedidos simultáneos a argenprop; los 429/5xx se reintentan
+# con backoff exponencial respetando el Retry-After del servidor
+MAX_CONNECTIONS = 8
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONNECTIONS,
+    pool_block=True,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True
+    )
+))
+
+def scrape_page(url, current_page, config, scrape_ts):
+    """Descarga y parsea una página de resultados"""
+    logger.info(f"Scrapeando página {current_page}...")
+    
+    response = SESSION.get(url, timeout=15)
+    response.raise_for_status()
+    
+    # Bytes directo al parser: lxml detecta la codificación (BOM / meta charset) sin chardet
+    doc = etree.HTML(response.content)
+    if doc is None:
+        return []
+    all_props = _XP_PROPS(doc)
+    
+    # Valores constantes de la corrida, resueltos una vez por página
+    prop_type = config['property_type']
+    op_type = config['operation_type']
+    loc = config['location']
+    
+    page_data = []
+    for prop in all_props:
+        links = _XP_LINK(prop)
+        if links:
+            link = links[0]
+            
+            # Un solo literal por propiedad en vez de asignar campo por campo
+            page_data.append({
+                'Nombre': _text_or(_XP_TITLE(link), 'No title available'),
+                'Precio': _text_or(_XP_PRICE(link), 'No price available'),
+                'Dirección': _text_or(_XP_ADDRESS(link), 'No address available'),
+                'Link': 'https://www.argenprop.com' + link.attrib['href'],
+                'Fecha_Scraping': scrape_ts,
+                'Pagina': current_page,
+                'Tipo_Propiedad': prop_type,
+                'Tipo_Operacion': op_type,
+                'Ubicacion': loc
+            })
+    
+    return page_data
+
 def scrape_props(config):
     """Función principal de scraping"""
     logger.info("Iniciando scraping con configuración:")
@@ -61,72 +171,184 @@ def scrape_props(config):
     logger.info(f"  - Rango: {config['price_range_from']} - {config['price_range_to']} {config['currency']}")
     logger.info(f"  - Páginas máximas: {config['max_pages']}")
     
-    current_page = 1
+    # Prefijo invariante: sólo cambia el número de página
+    base = f"https://www.argenprop.com/{config['property_type']}/{config['operation_type']}/{config['location']}?{config['price_range_from']}-{config['price_range_to']}-{config['currency']}&orden-{config['sort_by']}&pagina-"
+    urls = [base + str(current_page) for current_page in range(1, config['max_pages'] + 1)]
     data = []
     total_props = 0
+    if not urls:
+        return data
 
-    while current_page <= config['max_pages']:
-        try:
-            url = f"https://www.argenprop.com/{config['property_type']}/{config['operation_type']}/{config['location']}?{config['price_range_from']}-{config['price_range_to']}-{config['currency']}&orden-{config['sort_by']}&pagina-{str(current_page)}"
-            
-            logger.info(f"Scrapeando página {current_page}...")
-            
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            
-            doc = BeautifulSoup(response.text, 'html.parser')
-            all_props = doc.find_all('div', class_='listing__item')
+    # Una sola marca de tiempo para todas las propiedades de la corrida
+    scrape_ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Las páginas se descargan en paralelo (I/O) y se procesan en orden,
+    # cortando en la primera página vacía o con error como antes
+    max_workers = max(1, min(config.get('max_workers', 8), MAX_CONNECTIONS, len(urls)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(scrape_page, url, current_page, config, scrape_ts)
+            for current_page, url in enumerate(urls, 1)
+        ]
+        for current_page, future in enumerate(futures, 1):
+            try:
+                page_data = future.result()
+            except requests.RequestException as e:
+                logger.error(f"Error de conexión en página {current_page}: {str(e)}")
+                break
+            except Exception as e:
+                logger.error(f"Error inesperado en página {current_page}: {str(e)}")
+                break
             
-            if not all_props:
+            if not page_data:
                 logger.warning(f"No se encontraron propiedades en la página {current_page}")
                 break
             
-            page_props = 0
-            for prop in all_props:
-                item = {}
-                
-                link = prop.find('a')
-                if link:
-                    # Título
-                    title = link.find('h2', class_='card__title')
-                    item['Nombre'] = title.text.strip() if title else 'No title available'
-                    
-                    # Precio
-                    price = link.find('p', class_='card__price')
-                    item['Precio'] = price.text.strip() if price else 'No price available'
-                    
-                    # Dirección
-                    address = link.find('p', class_='card__address')
-                    item['Dirección'] = address.text.strip() if address else 'No address available'
-                    
-                    # Link completo
-                    item['Link'] = 'https://www.argenprop.com' + link['href']
-                    
-                    # Información adicional
-                    item['Fecha_Scraping'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    item['Pagina'] = current_page
-                    item['Tipo_Propiedad'] = config['property_type']
-                    item['Tipo_Operacion'] = config['operation_type']
-                    item['Ubicacion'] = config['location']
-
-                    data.append(item)
-                    page_props += 1
-            
-            total_props += page_props
-            logger.info(f"  - Página {current_page}: {page_props} propiedades encontradas")
-            
-        except requests.RequestException as e:
-            logger.error(f"Error de conexión en página {current_page}: {str(e)}")
-            break
-        except Exception as e:
-            logger.error(f"Error inesperado en página {current_page}: {str(e)}")
-            break
+            data.extend(page_data)
+            total_props += len(page_data)
+            logger.info(f"  - Página {current_page}: {len(page_data)} propiedades encontradas")
         
-        current_page += 1
+        # Descartar las páginas que todavía no empezaron
+        for future in futures:
+            future.cancel()
     
     logger.info(f"Scraping completado. Total de propiedades: {total_props}")
     return data
 
+# Histórico canónico en Parquet; el Excel se genera sólo a pedido
+HISTORICO_DS = os.path.join('resultados', 'historico_ds')
+
+# Último contenido guardado por link (link -> hash de los campos), persistido entre corridas
+SEEN_ROWS_PATH = os.path.join('resultados', '.seen_rows.pkl')
+_CONTENT_COLUMNS = ['Nombre', 'Precio', 'Dirección']
+
+def load_seen_rows():
+    """Hash del último registro guardado por link (vacío en la primera corrida)"""
+    try:
+        with open(SEEN_ROWS_PATH, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return {}
+
+def content_hashes(df):
+    """Hash por fila de los campos que pueden cambiar en un aviso (precio, título, dirección)"""
+    return pd.util.hash_pandas_object(df[_CONTENT_COLUMNS], index=False).tolist()
+
+def load_historico():
+    """Lee el histórico completo, sin duplicados por Link (queda el más reciente)"""
+    df = pd.read_parquet(HISTORICO_DS)
+    return df.sort_values('Fecha_Scraping', kind='stable').drop_duplicates(subset=['Link'], keep='last')
+
+# Partes mínimas de un .xlsx (OOXML) con una sola hoja
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+# Caracteres de control que no son válidos en XML
+_XML_ILLEGAL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _xlsx_cell(value):
+    """Celda OOXML: número nativo, texto inline o vacía"""
+    if value is None or value != value:
+        return '<c/>'
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL_RE.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def fast_dump_xlsx(path, columns, rows, sheet_name='Historico'):
+    """Escribe un .xlsx armando el XML de la hoja directamente (para exportaciones grandes)"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(sheet_name=escape(sheet_name)))
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        # La hoja se escribe en streaming, fila por fila
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            for row in itertools.chain([columns], rows):
+                sheet.write(('<row>' + ''.join(map(_xlsx_cell, row)) + '</row>').encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+def export_historico_xlsx(filepath=None):
+    """Exporta el histórico a Excel (bajo demanda); en re-exportaciones actualiza las filas modificadas"""
+    filepath = filepath or os.path.join('resultados', 'scraping_historico.xlsx')
+    # Side-car junto al libro: link -> (fila en la hoja, hash del contenido exportado)
+    links_path = filepath + '.rows.pkl'
+    df = load_historico()
+    hashes = content_hashes(df)
+    if not os.path.exists(filepath):
+        fast_dump_xlsx(filepath, list(df.columns), df.itertuples(index=False, name=None))
+        exported = {link: (row_idx, h) for row_idx, (link, h) in enumerate(zip(df['Link'], hashes), start=2)}
+    else:
+        # Ya exportado: actualizar en su lugar las filas que cambiaron y agregar los links nuevos
+        wb = load_workbook(filepath)
+        ws = wb.active
+        headers = [cell.value for cell in ws[1]]
+        try:
+            with open(links_path, 'rb') as f:
+                exported = pickle.load(f)
+        except FileNotFoundError:
+            # Sin side-car: ubicar las filas por link; sin hash conocido se reescriben una vez
+            link_idx = headers.index('Link')
+            exported = {
+                row[link_idx]: (row_idx, None)
+                for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2)
+            }
+        
+        rows = df.reindex(columns=headers).itertuples(index=False, name=None)
+        for link, h, row in zip(df['Link'], hashes, rows):
+            previous = exported.get(link)
+            if previous is None:
+                ws.append(row)
+                exported[link] = (ws.max_row, h)
+            elif previous[1] != h:
+                row_idx = previous[0]
+                for col_idx, value in enumerate(row, start=1):
+                    ws.cell(row=row_idx, column=col_idx, value=value)
+                exported[link] = (row_idx, h)
+        wb.save(filepath)
+    
+    with open(links_path, 'wb') as f:
+        pickle.dump(exported, f, protocol=5)
+    return filepath
+
+def write_excel_rows(df, filepath, sheet_name='Scraping'):
+    """Escribe el DataFrame fila por fila con un libro openpyxl write-only (sin estilos por celda)"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(filepath)
+
 def save_to_excel_and_sheets(data, config):
     """Guarda los datos en Excel local y Google Sheets"""
     if not data:
@@ -151,32 +373,34 @@ def save_to_excel_and_sheets(data, config):
         
         # 1. Guardar en Excel local (respaldo)
         try:
-            # Archivo principal con todos los datos
-            main_filepath = os.path.join(results_dir, 'scraping_historico.xlsx')
-            
             # Guardar archivo del día
-            df.to_excel(filepath, index=False)
+            write_excel_rows(df, filepath)
             logger.info(f"📁 Archivo diario guardado: {filepath}")
             
-            # Agregar al archivo histórico
-            if os.path.exists(main_filepath):
-                # Leer archivo existente
-                try:
-                    existing_df = pd.read_excel(main_filepath)
-                    # Combinar con nuevos datos
-                    combined_df = pd.concat([existing_df, df], ignore_index=True)
-                    # Eliminar duplicados basados en el link (si los hay)
-                    combined_df = combined_df.drop_duplicates(subset=['Link'], keep='last')
-                    combined_df.to_excel(main_filepath, index=False)
-                    logger.info(f"📁 Datos agregados al archivo histórico: {main_filepath}")
-                except Exception as e:
-                    logger.error(f"❌ Error actualizando archivo histórico: {str(e)}")
-                    # Si hay error, guardar como nuevo archivo
-                    df.to_excel(main_filepath, index=False)
-            else:
-                # Crear nuevo archivo histórico
-                df.to_excel(main_filepath, index=False)
-                logger.info(f"📁 Nuevo archivo histórico creado: {main_filepath}")
+            # Agregar al histórico: dataset Parquet particionado, sólo se escriben los links
+            # nuevos o cuyo contenido cambió (p. ej. el precio) desde la última vez
+            try:
+                seen_rows = load_seen_rows()
+                hashes = content_hashes(df)
+                changed = [seen_rows.get(link) != h for link, h in zip(df['Link'], hashes)]
+                new_df = df[changed]
+                if not new_df.empty:
+                    pq.write_to_dataset(
+                        pa.Table.from_pandas(new_df, preserve_index=False),
+                        root_path=HISTORICO_DS,
+                        partition_cols=['Tipo_Propiedad', 'Tipo_Operacion'],
+                        compression='snappy'
+                    )
+                    seen_rows.update(
+                        (link, h) for link, h, is_changed in zip(df['Link'], hashes, changed) if is_changed
+                    )
+                    with open(SEEN_ROWS_PATH, 'wb') as f:
+                        pickle.dump(seen_rows, f, protocol=5)
+                    logger.info(f"📁 {len(new_df)} propiedades nuevas o modificadas agregadas al histórico: {HISTORICO_DS}")
+                else:
+                    logger.info("📁 Sin cambios para el histórico")
+            except Exception as e:
+                logger.error(f"❌ Error actualizando histórico: {str(e)}")
             
             excel_success = True
             
@@ -188,8 +412,8 @@ def save_to_excel_and_sheets(data, config):
             try:
                 logger.info("☁️ Intentando guardar en Google Sheets...")
                 
-                # Crear manager de Google Sheets
-                sheets_manager = GoogleSheetsManager()
+                # Manager de Google Sheets (autenticado una sola vez por proceso)
+                sheets_manager = get_sheets_manager()
                 
                 # Guardar en Google Sheets
                 sheets_url = sheets_manager.save_properties_to_sheet(
@@ -231,27 +455,18 @@ def create_summary_report(data, config):
         # Estadísticas básicas
         total_props = len(df)
         
-        # Análisis de precios (si hay datos de precio válidos)
-        prices = []
-        for price_str in df['Precio']:
-            if 'No price available' not in price_str:
-                # Extraer números del string de precio
-                import re
-                numbers = re.findall(r'[\d.,]+', price_str.replace('.', '').replace(',', ''))
-                if numbers:
-                    try:
-                        price_num = float(numbers[0])
-                        prices.append(price_num)
-                    except:
-                        pass
+        # Análisis de precios (si hay datos de precio válidos), vectorizado
+        mask = ~df['Precio'].str.contains('No price available', regex=False)
+        cleaned = df.loc[mask, 'Precio'].str.replace(_PRICE_SEP_RE, '', regex=True)
+        prices = pd.to_numeric(cleaned.str.extract(_PRICE_RE, expand=False), errors='coerce').dropna().to_numpy(dtype=float)
         
         summary = {
             'fecha_scraping': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'total_propiedades': total_props,
             'configuracion': config,
-            'precio_promedio': sum(prices) / len(prices) if prices else 0,
-            'precio_minimo': min(prices) if prices else 0,
-            'precio_maximo': max(prices) if prices else 0,
+            'precio_promedio': prices.mean() if prices.size else 0,
+            'precio_minimo': prices.min() if prices.size else 0,
+            'precio_maximo': prices.max() if prices.size else 0,
             'propiedades_con_precio': len(prices)
         }
         
@@ -259,7 +474,7 @@ def create_summary_report(data, config):
         logger.info(f"Fecha: {summary['fecha_scraping']}")
         logger.info(f"Total de propiedades: {summary['total_propiedades']}")
         logger.info(f"Propiedades con precio: {summary['propiedades_con_precio']}")
-        if prices:
+        if prices.size:
             logger.info(f"Precio promedio: ${summary['precio_promedio']:,.2f}")
             logger.info(f"Precio mínimo: ${summary['precio_minimo']:,.2f}")
             logger.info(f"Precio máximo: ${summary['precio_maximo']:,.2f}")
@@ -305,8 +520,13 @@ def main():
         return False
     
     finally:
+        SESSION.close()
         logger.info("=== FIN DE SCRAPING DIARIO ===")
 
 if __name__ == "__main__":
+    if '--exportar-historico' in sys.argv:
+        print(f"📁 Histórico exportado: {export_historico_xlsx()}")
+        sys.exit(0)
+    
     success = main()
     sys.exit(0 if success else 1)
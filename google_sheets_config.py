@@ -27,6 +27,8 @@ class GoogleSheetsManager:
         self.credentials_file = credentials_file
         self.token_file = token_file
         self.gc = None
+        # Hojas de cálculo ya abiertas, por nombre
+        self._spreadsheets = {}
         self.authenticate()
     
     def authenticate(self):
@@ -70,6 +72,9 @@ class GoogleSheetsManager:
         Returns:
             Objeto Spreadsheet de gspread
         """
+        if spreadsheet_name in self._spreadsheets:
+            return self._spreadsheets[spreadsheet_name]
+        
         try:
             # Intenta abrir la hoja existente
             spreadsheet = self.gc.open(spreadsheet_name)
@@ -81,7 +86,8 @@ class GoogleSheetsManager:
             
             # Comparte la hoja contigo (opcional)
             # spreadsheet.share('tu_email@gmail.com', perm_type='user', role='writer')
-            
+        
+        self._spreadsheets[spreadsheet_name] = spreadsheet
         return spreadsheet
     
     def save_properties_to_sheet(self, properties_data, spreadsheet_name="Props Scraper - Resultados"):
@@ -97,67 +103,34 @@ class GoogleSheetsManager:
             return
         
         try:
-            # Obtiene o crea la hoja de cálculo
-            spreadsheet = self.create_or_get_spreadsheet(spreadsheet_name)
+            # Encabezados: campos de la primera propiedad más la columna de timestamp
+            headers = list(properties_data[0])
+            if 'Fecha_Scraping' not in headers:
+                headers.append('Fecha_Scraping')
+            ts_idx = headers.index('Fecha_Scraping')
+            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            # Crea el nombre de la hoja con la fecha actual
-            today = datetime.now().strftime("%Y-%m-%d")
-            sheet_name = f"Scraping_{today}"
+            # Filas directo desde los diccionarios, sin armar un DataFrame
+            data = []
+            for row in properties_data:
+                values = [str(row.get(h, '')) for h in headers]
+                values[ts_idx] = ts
+                data.append(values)
             
-            # Verifica si la hoja ya existe
+            # Obtiene o crea la hoja de cálculo (puede venir de la caché del manager)
+            cached = spreadsheet_name in self._spreadsheets
+            spreadsheet = self.create_or_get_spreadsheet(spreadsheet_name)
             try:
-                worksheet = spreadsheet.worksheet(sheet_name)
-                print(f"📋 Hoja '{sheet_name}' ya existe, se actualizará")
-            except gspread.WorksheetNotFound:
-                # Crea una nueva hoja
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="1000", cols="20")
-                print(f"📋 Nueva hoja '{sheet_name}' creada")
-            
-            # Convierte los datos a DataFrame para facilitar el manejo
-            df = pd.DataFrame(properties_data)
-            
-            # Agrega columna de timestamp
-            df['Fecha_Scraping'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Prepara los datos para Google Sheets
-            # Encabezados
-            headers = list(df.columns)
-            
-            # Datos (convierte todo a string para evitar problemas)
-            data = df.astype(str).values.tolist()
-            
-            # Limpia la hoja y agrega los nuevos datos
-            worksheet.clear()
-            
-            # Agrega encabezados
-            worksheet.append_row(headers)
-            
-            # Agrega los datos
-            if data:
-                worksheet.append_rows(data)
-            
-            # Formatea los encabezados (opcional)
-            worksheet.format('A1:Z1', {
-                "backgroundColor": {
-                    "red": 0.2,
-                    "green": 0.6,
-                    "blue": 0.9
-                },
-                "textFormat": {
-                    "foregroundColor": {
-                        "red": 1.0,
-                        "green": 1.0,
-                        "blue": 1.0
-                    },
-                    "fontSize": 12,
-                    "bold": True
-                }
-            })
-            
-            print(f"✅ {len(data)} propiedades guardadas en Google Sheets")
-            print(f"🔗 URL: {spreadsheet.url}")
-            
-            return spreadsheet.url
+                return self._write_to_spreadsheet(spreadsheet, headers, data)
+            except (gspread.exceptions.APIError, gspread.SpreadsheetNotFound):
+                if not cached:
+                    raise
+                # El handle cacheado puede apuntar a una hoja borrada o recreada:
+                # se descarta, se vuelve a abrir y se reintenta una vez
+                print(f"🔄 Reabriendo la hoja de cálculo '{spreadsheet_name}'")
+                self._spreadsheets.pop(spreadsheet_name, None)
+                spreadsheet = self.create_or_get_spreadsheet(spreadsheet_name)
+                return self._write_to_spreadsheet(spreadsheet, headers, data)
             
         except Exception as e:
             print(f"❌ Error al guardar en Google Sheets: {str(e)}")
@@ -165,6 +138,62 @@ class GoogleSheetsManager:
             self.save_to_local_excel(properties_data)
             return None
     
+    def _write_to_spreadsheet(self, spreadsheet, headers, data):
+        """Escribe encabezados y filas en la hoja del día y devuelve la URL de la hoja de cálculo"""
+        # Crea el nombre de la hoja con la fecha actual
+        today = datetime.now().strftime("%Y-%m-%d")
+        sheet_name = f"Scraping_{today}"
+        
+        # Verifica si la hoja ya existe
+        try:
+            worksheet = spreadsheet.worksheet(sheet_name)
+            print(f"📋 Hoja '{sheet_name}' ya existe, se actualizará")
+        except gspread.WorksheetNotFound:
+            # Crea una nueva hoja
+            worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="1000", cols="20")
+            print(f"📋 Nueva hoja '{sheet_name}' creada")
+        
+        # Limpieza, formato de encabezados y tamaño de la grilla en una sola llamada batch
+        requests = [
+            {'updateCells': {'range': {'sheetId': worksheet.id}, 'fields': 'userEnteredValue'}},
+            {'repeatCell': {
+                'range': {'sheetId': worksheet.id, 'startRowIndex': 0, 'endRowIndex': 1,
+                          'startColumnIndex': 0, 'endColumnIndex': 26},
+                'cell': {'userEnteredFormat': {
+                    "backgroundColor": {
+                        "red": 0.2,
+                        "green": 0.6,
+                        "blue": 0.9
+                    },
+                    "textFormat": {
+                        "foregroundColor": {
+                            "red": 1.0,
+                            "green": 1.0,
+                            "blue": 1.0
+                        },
+                        "fontSize": 12,
+                        "bold": True
+                    }
+                }},
+                'fields': 'userEnteredFormat(backgroundColor,textFormat)'
+            }}
+        ]
+        missing_rows = len(data) + 1 - worksheet.row_count
+        if missing_rows > 0:
+            requests.append({'appendDimension': {'sheetId': worksheet.id, 'dimension': 'ROWS', 'length': missing_rows}})
+        spreadsheet.batch_update({'requests': requests})
+        
+        # Encabezados y datos en una sola escritura
+        spreadsheet.values_batch_update({
+            'valueInputOption': 'RAW',
+            'data': [{'range': f"'{sheet_name}'!A1", 'values': [headers] + data}]
+        })
+        
+        print(f"✅ {len(data)} propiedades guardadas en Google Sheets")
+        print(f"🔗 URL: {spreadsheet.url}")
+        
+        return spreadsheet.url
+    
     def save_to_local_excel(self, properties_data):
         """
         Método de respaldo para guardar en Excel local si falla Google Sheets
@@ -202,6 +231,16 @@ class GoogleSheetsManager:
             print(f"❌ Error al obtener URL: {str(e)}")
             return None
 
+# Manager compartido: se autentica una sola vez por proceso
+_MANAGER = None
+
+def get_sheets_manager():
+    """Devuelve el GoogleSheetsManager del proceso, creándolo (y autenticando) la primera vez"""
+    global _MANAGER
+    if _MANAGER is None:
+        _MANAGER = GoogleSheetsManager()
+    return _MANAGER
+
 # Función de utilidad para uso rápido
 def save_to_google_sheets(properties_data, spreadsheet_name="Props Scraper - Resultados"):
     """
@@ -215,8 +254,7 @@ def save_to_google_sheets(properties_data, spreadsheet_name="Props Scraper - Res
         URL de la hoja de cálculo o None si falla
     """
     try:
-        manager = GoogleSheetsManager()
-        return manager.save_properties_to_sheet(properties_data, spreadsheet_name)
+        return get_sheets_manager().save_properties_to_sheet(properties_data, spreadsheet_name)
     except Exception as e:
         print(f"❌ Error en save_to_google_sheets: {str(e)}")
         return None
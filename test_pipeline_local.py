@@ -6,15 +6,18 @@ Script para probar el pipeline ETL de forma local sin Airflow
 import sys
 import os
 import logging
+import json
+import hashlib
+import shutil
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # Agregar el directorio actual al path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Importar funciones del pipeline
-from airflow_utils.extraction import extract_properties_data, PropsScraper
-from airflow_utils.transformation import transform_properties_data, DataTransformer
-from airflow_utils.loading import load_final_dataset, DataLoader
+# Los módulos del pipeline (pandas, pyarrow, requests...) se importan dentro de cada
+# prueba, así el menú interactivo arranca sin esperar esas importaciones
 
 # Configurar logging
 logging.basicConfig(
@@ -23,8 +26,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Caché de scrapings de prueba, indexada por hash de la configuración
+SCRAPE_CACHE_DIR = '.scrape_cache'
+
 def test_pipeline_locally():
     """Ejecuta el pipeline completo de forma local"""
+    from airflow_utils.extraction import PropsScraper
+    from airflow_utils.transformation import DataTransformer
+    from airflow_utils.loading import DataLoader
+    
+    # Una sola marca de tiempo para nombres de archivo y reporte de la corrida
+    run_start = datetime.now()
+    timestamp = run_start.strftime("%Y%m%d_%H%M%S")
     
     print("🚀 INICIANDO PRUEBA LOCAL DEL PIPELINE ETL")
     print("=" * 60)
@@ -41,63 +54,97 @@ def test_pipeline_locally():
         'sort_by': 'masnuevos'
     }
     
+    # Excel es el formato más lento: solo a pedido
+    emit_excel = '--excel' in sys.argv
+    
     try:
         # ============== FASE 1: EXTRACCIÓN ==============
         print("\n📥 FASE 1: EXTRACCIÓN DE DATOS")
         print("-" * 40)
         
-        scraper = PropsScraper()
-        raw_data = scraper.scrape_properties(config)
+        # Datos raw cacheados por configuración (Feather/Arrow IPC, se relee con memory_map):
+        # mientras se depura no se vuelve a scrapear. FORCE_RESCRAPE=1 fuerza un scraping nuevo
+        import pyarrow.feather as feather
+        cache_key = hashlib.blake2b(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+        raw_file = os.path.join(SCRAPE_CACHE_DIR, f"{cache_key}.feather")
+        
+        if os.path.exists(raw_file) and not os.environ.get('FORCE_RESCRAPE'):
+            raw_table = feather.read_table(raw_file, memory_map=True)
+            print(f"♻️ Datos raw leídos de la caché: {raw_file}")
+        else:
+            scraper = PropsScraper()
+            raw_table = scraper.scrape_properties(config)
+            
+            if raw_table.num_rows > 0:
+                os.makedirs(SCRAPE_CACHE_DIR, exist_ok=True)
+                feather.write_feather(raw_table, raw_file, compression='zstd')
+                print(f"📁 Datos raw guardados en: {raw_file}")
         
-        if not raw_data:
+        if raw_table.num_rows == 0:
             raise ValueError("No se pudieron extraer datos")
         
-        print(f"✅ Extracción exitosa: {len(raw_data)} propiedades")
-        
-        # Guardar datos raw
-        import json
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        raw_file = f"test_raw_data_{timestamp}.json"
-        
-        with open(raw_file, 'w', encoding='utf-8') as f:
-            json.dump(raw_data, f, ensure_ascii=False, indent=2)
-        print(f"📁 Datos raw guardados en: {raw_file}")
+        print(f"✅ Extracción exitosa: {raw_table.num_rows} propiedades")
         
         # ============== FASE 2: TRANSFORMACIÓN ==============
         print("\n🔄 FASE 2: TRANSFORMACIÓN DE DATOS")
         print("-" * 40)
         
         transformer = DataTransformer()
-        df_transformed = transformer.transform_properties_data(raw_data)
+        # La tabla Arrow (columnar) pasa directo al transformer, sin lista de dicts
+        df_transformed = transformer.transform_properties_data(raw_table)
         
         if df_transformed.empty:
             raise ValueError("La transformación resultó en un DataFrame vacío")
         
         print(f"✅ Transformación exitosa: {df_transformed.shape}")
-        
-        # Guardar datos transformados
-        parquet_file = f"test_transformed_data_{timestamp}.parquet"
-        df_transformed.to_parquet(parquet_file, index=False)
-        print(f"📁 Datos transformados guardados en: {parquet_file}")
+        # Sin checkpoint intermedio: el DataFrame pasa en memoria a la carga,
+        # que ya deja su propia copia en Parquet
         
         # ============== FASE 3: CARGA ==============
         print("\n💾 FASE 3: CARGA DEL DATASET")
         print("-" * 40)
         
-        # Crear directorio de salida
+        # Los archivos se escriben en un directorio de staging que se publica con un
+        # rename atómico: nunca queda un dataset a medio escribir en output_dir
         output_dir = f"test_output_{timestamp}"
-        os.makedirs(output_dir, exist_ok=True)
+        staging_dir = output_dir + '.tmp'
         
-        loader = DataLoader(data_dir=output_dir)
+        loader = DataLoader(data_dir=staging_dir)
         base_filename = f"propiedades_test_{timestamp}"
         
-        # Guardar en múltiples formatos
-        files_created = {}
-        files_created['excel'] = loader.save_to_excel(df_transformed, base_filename)
-        files_created['csv'] = loader.save_to_csv(df_transformed, base_filename)
-        files_created['parquet'] = loader.save_to_parquet(df_transformed, base_filename)
-        files_created['json'] = loader.save_to_json(df_transformed, base_filename)
-        files_created['metadata'] = loader.create_metadata_file(df_transformed, base_filename)
+        # Métricas calculadas una sola vez: las usan Excel, metadatos, validaciones y reporte
+        stats = loader.compute_stats(df_transformed)
+        
+        # Conversión a Arrow una sola vez, compartida por los writers de Parquet y CSV
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df_transformed, preserve_index=False)
+        
+        # Guardar en múltiples formatos en paralelo (escrituras independientes, I/O)
+        writers = [
+            ('csv', loader.save_to_csv, table),
+            ('parquet', loader.save_to_parquet, table),
+            ('json', loader.save_to_json, df_transformed),
+            ('metadata', partial(loader.create_metadata_file, stats=stats), df_transformed),
+        ]
+        if emit_excel:
+            writers.append(('excel', partial(loader.save_to_excel, stats=stats), df_transformed))
+        with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+            futures = {
+                format_name: executor.submit(writer, data, base_filename)
+                for format_name, writer, data in writers
+            }
+        # Al salir del with terminaron todos los writers: si alguno falló, se descarta el staging
+        try:
+            files_created = {format_name: future.result() for format_name, future in futures.items()}
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        
+        os.rename(staging_dir, output_dir)
+        files_created = {
+            format_name: os.path.join(output_dir, os.path.basename(filepath))
+            for format_name, filepath in files_created.items()
+        }
         
         print(f"✅ Dataset final creado en directorio: {output_dir}")
         
@@ -107,45 +154,40 @@ def test_pipeline_locally():
         
         # Validaciones básicas
         validations = {
-            'total_records': len(df_transformed) > 0,
-            'has_valid_prices': df_transformed['precio_valido'].sum() > 0,
-            'has_locations': df_transformed['barrio'].notna().sum() > 0,
-            'quality_acceptable': df_transformed['calidad_score'].mean() >= 20,
+            'total_records': stats['total'] > 0,
+            'has_valid_prices': stats['precios_validos'] > 0,
+            'has_locations': stats['con_ubicacion'] > 0,
+            'quality_acceptable': stats['calidad_score']['mean'] >= 20,
             'files_exist': all(os.path.exists(path) for path in files_created.values())
         }
         
-        print("Resultados de validación:")
-        for check, passed in validations.items():
-            status = "✅ PASS" if passed else "❌ FAIL"
-            print(f"  {check}: {status}")
+        # Resultados y reporte armados en un buffer y escritos de una sola vez
+        lines = ["Resultados de validación:"]
+        lines += [f"  {check}: {'✅ PASS' if passed else '❌ FAIL'}" for check, passed in validations.items()]
         
         # ============== REPORTE FINAL ==============
-        print("\n📊 REPORTE FINAL")
-        print("=" * 60)
-        print(f"📅 Fecha de ejecución: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"📈 Total de propiedades procesadas: {len(df_transformed)}")
-        print(f"💰 Propiedades con precio válido: {df_transformed['precio_valido'].sum()}")
-        print(f"📍 Barrios únicos encontrados: {df_transformed['barrio'].nunique()}")
-        print(f"⭐ Calidad promedio: {df_transformed['calidad_score'].mean():.1f}/100")
-        
-        if df_transformed['precio_valido'].any():
-            precios_validos = df_transformed[df_transformed['precio_valido'] == True]['precio_numerico']
-            print(f"💵 Precio promedio: ${precios_validos.mean():,.2f}")
-            print(f"💵 Rango de precios: ${precios_validos.min():,.2f} - ${precios_validos.max():,.2f}")
-        
-        print(f"\n📁 Archivos generados:")
-        for format_name, filepath in files_created.items():
-            print(f"  - {format_name.upper()}: {filepath}")
-        
-        print(f"\n🎉 ¡PIPELINE EJECUTADO EXITOSAMENTE!")
-        
-        # Limpiar archivos temporales
-        try:
-            os.remove(raw_file)
-            os.remove(parquet_file)
-            print(f"\n🧹 Archivos temporales eliminados")
-        except:
-            pass
+        lines += [
+            "\n📊 REPORTE FINAL",
+            "=" * 60,
+            f"📅 Fecha de ejecución: {run_start:%Y-%m-%d %H:%M:%S}",
+            f"📈 Total de propiedades procesadas: {stats['total']}",
+            f"💰 Propiedades con precio válido: {stats['precios_validos']}",
+            f"📍 Barrios únicos encontrados: {stats['barrios_unicos']}",
+            f"⭐ Calidad promedio: {stats['calidad_score']['mean']:.1f}/100",
+        ]
+        
+        precios = stats['precios']
+        if precios:
+            lines += [
+                f"💵 Precio promedio: ${precios['mean']:,.2f}",
+                f"💵 Rango de precios: ${precios['min']:,.2f} - ${precios['max']:,.2f}",
+            ]
+        
+        lines.append("\n📁 Archivos generados:")
+        lines += [f"  - {format_name.upper()}: {filepath}" for format_name, filepath in files_created.items()]
+        lines.append("\n🎉 ¡PIPELINE EJECUTADO EXITOSAMENTE!")
+        
+        sys.stdout.write('\n'.join(lines) + '\n')
         
         return True
         
@@ -156,6 +198,9 @@ def test_pipeline_locally():
 
 def test_individual_components():
     """Prueba componentes individuales del pipeline"""
+    from airflow_utils.extraction import PropsScraper
+    from airflow_utils.transformation import DataTransformer
+    from airflow_utils.loading import DataLoader
     
     print("\n🔧 PRUEBA DE COMPONENTES INDIVIDUALES")
     print("=" * 60)
@@ -196,6 +241,15 @@ def test_individual_components():
         print(f"   Precio extraído: ${df_test.iloc[0]['precio_numerico']:,.2f}")
         print(f"   Barrio extraído: {df_test.iloc[0]['barrio']}")
         
+        # Lote sin ningún precio numérico (todo "Consultar"): no debe romper la transformación
+        df_consultar = transformer.transform_properties_data([
+            dict(test_data[0], precio='Consultar precio', link=f'https://ejemplo.com/consultar{i}')
+            for i in range(3)
+        ])
+        assert not df_consultar['precio_valido'].any(), "precio_valido debería ser False"
+        assert df_consultar['precio_numerico'].isna().all(), "precio_numerico debería ser NaN"
+        print(f"✅ Lote 'Consultar precio': {df_consultar.shape}, calidad_score={df_consultar.iloc[0]['calidad_score']}")
+        
     except Exception as e:
         print(f"❌ Error en transformer: {e}")
     
@@ -4,13 +4,38 @@ Verifica que todos los componentes estén correctamente configurados
 """
 
 import os
+import re
 import sys
 import importlib.util
+import py_compile
 from pathlib import Path
+from functools import lru_cache
+
+# Paquetes críticos: nombre en PyPI -> nombre de import
+_IMPORT_NAMES = {
+    'pandas': 'pandas',
+    'numpy': 'numpy',
+    'requests': 'requests',
+    'beautifulsoup4': 'bs4'
+}
+
+@lru_cache(maxsize=None)
+def _list_dir(dirpath):
+    """Entradas de un directorio (nombre -> es directorio), con un solo scandir por carpeta"""
+    try:
+        with os.scandir(dirpath) as entries:
+            return {entry.name: entry.is_dir() for entry in entries}
+    except OSError:
+        return {}
+
+def path_exists(path, is_dir=None):
+    """Existencia (y tipo, si se pide) de un Path usando el listado cacheado de su carpeta"""
+    kind = _list_dir(path.parent).get(path.name)
+    return kind is not None and (is_dir is None or kind == is_dir)
 
 def check_file_exists(filepath, description):
-    """Verifica que un archivo existe"""
-    if os.path.exists(filepath):
+    """Verifica que un archivo existe (y que no es un directorio)"""
+    if path_exists(filepath, is_dir=False):
         print(f"✅ {description}: {filepath}")
         return True
     else:
@@ -18,38 +43,20 @@ def check_file_exists(filepath, description):
         return False
 
 def check_python_syntax(filepath):
-    """Verifica la sintaxis de un archivo Python"""
+    """Verifica la sintaxis de un archivo Python (solo compila, no ejecuta el módulo)"""
     try:
-        spec = importlib.util.spec_from_file_location("module", filepath)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        py_compile.compile(str(filepath), doraise=True)
         print(f"✅ Sintaxis válida: {filepath}")
         return True
-    except Exception as e:
+    except py_compile.PyCompileError as e:
         print(f"❌ Error de sintaxis en {filepath}: {e}")
         return False
 
 def check_imports(filepath):
     """Verifica que las imports necesarias están disponibles"""
     try:
-        # Leer el archivo y buscar imports
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Lista de imports críticos
-        critical_imports = [
-            'pandas',
-            'numpy', 
-            'requests',
-            'beautifulsoup4'
-        ]
-        
-        missing = []
-        for imp in critical_imports:
-            try:
-                __import__(imp)
-            except ImportError:
-                missing.append(imp)
+        # find_spec solo busca el módulo en sys.path, no lo importa
+        missing = [pypi for pypi, module in _IMPORT_NAMES.items() if importlib.util.find_spec(module) is None]
         
         if missing:
             print(f"⚠️ Dependencias faltantes: {missing}")
@@ -101,7 +108,7 @@ def main():
     }
     
     for description, dirpath in required_dirs.items():
-        if os.path.exists(dirpath) and os.path.isdir(dirpath):
+        if path_exists(dirpath, is_dir=True):
             print(f"✅ Directorio {description}: {dirpath}")
         else:
             print(f"❌ Directorio {description}: {dirpath} - NO ENCONTRADO")
@@ -119,7 +126,7 @@ def main():
     ]
     
     for filepath in python_files:
-        if os.path.exists(filepath):
+        if path_exists(filepath, is_dir=False):
             if not check_python_syntax(filepath):
                 all_checks_passed = False
     
@@ -128,21 +135,24 @@ def main():
     print("-" * 40)
     
     dag_file = base_path / 'dags' / 'propiedades_etl_dag.py'
-    if os.path.exists(dag_file):
+    if path_exists(dag_file, is_dir=False):
         try:
             with open(dag_file, 'r', encoding='utf-8') as f:
                 dag_content = f.read()
             
-            # Verificar elementos clave del DAG
-            dag_checks = {
-                'DAG definido': 'dag = DAG(' in dag_content,
-                'Tasks de extracción': 'extract_properties' in dag_content,
-                'Tasks de transformación': 'transform_properties' in dag_content,
-                'Tasks de carga': 'load_dataset' in dag_content,
-                'Tasks de validación': 'validate_dataset' in dag_content,
-                'Configuración de parámetros': 'SCRAPING_CONFIG' in dag_content,
-                'Documentación': 'dag.doc_md' in dag_content
+            # Verificar elementos clave del DAG (todos los marcadores en una sola pasada)
+            markers = {
+                'DAG definido': 'dag = DAG(',
+                'Tasks de extracción': 'extract_properties',
+                'Tasks de transformación': 'transform_properties',
+                'Tasks de carga': 'load_dataset',
+                'Tasks de validación': 'validate_dataset',
+                'Configuración de parámetros': 'SCRAPING_CONFIG',
+                'Documentación': 'dag.doc_md'
             }
+            pattern = re.compile('|'.join(re.escape(marker) for marker in markers.values()))
+            found = set(pattern.findall(dag_content))
+            dag_checks = {name: marker in found for name, marker in markers.items()}
             
             for check_name, passed in dag_checks.items():
                 if passed:
@@ -160,10 +170,16 @@ def main():
     print("-" * 40)
     
     req_file = base_path / 'requirements.txt'
-    if os.path.exists(req_file):
+    if path_exists(req_file, is_dir=False):
         try:
-            with open(req_file, 'r') as f:
-                requirements = f.read()
+            # Nombres de paquete sin versión, en un set (requirements.txt está en UTF-16)
+            raw = req_file.read_bytes()
+            encoding = 'utf-16' if raw.startswith((b'\xff\xfe', b'\xfe\xff')) else 'utf-8-sig'
+            requirements = {
+                re.split(r'[<>=!~;\[\s]', line.strip(), maxsplit=1)[0].lower()
+                for line in raw.decode(encoding).splitlines()
+                if line.strip() and not line.lstrip().startswith('#')
+            }
             
             required_packages = [
                 'apache-airflow',
@@ -174,7 +190,7 @@ def main():
             ]
             
             for package in required_packages:
-                if package in requirements:
+                if package.lower() in requirements:
                     print(f"✅ {package} incluido")
                 else:
                     print(f"❌ {package} faltante")
@@ -191,13 +207,13 @@ def main():
     astro_file = base_path / 'astro.yaml'
     dockerfile = base_path / 'Dockerfile'
     
-    if os.path.exists(astro_file):
+    if path_exists(astro_file, is_dir=False):
         print("✅ astro.yaml presente")
     else:
         print("❌ astro.yaml faltante")
         all_checks_passed = False
     
-    if os.path.exists(dockerfile):
+    if path_exists(dockerfile, is_dir=False):
         print("✅ Dockerfile presente")
     else:
         print("❌ Dockerfile faltante")